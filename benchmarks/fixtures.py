@@ -0,0 +1,238 @@
+"""Listing-page fixtures for the offline benchmarks.
+
+Synthetic pages reproduce the markup the extractors read, filled with a
+copy of the sample rows originally committed under ``extracted_data/``
+(kept in ``benchmarks/fixtures/``, so crawls that rewrite those files do
+not change the fixtures). Recorded pages can be
+exported from the snapshot cache into ``benchmarks/fixtures/`` with::
+
+    python -m benchmarks.fixtures --crawl-id latest --site framesdirect
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import html
+import json
+import os
+import re
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+SITES = ('framesdirect', 'glasses')
+
+
+def _cents_to_text(value, prefix='$'):
+    return f"{prefix}{int(value) / 100:.2f}" if value not in (None, '') else ''
+
+
+def sample_rows(site):
+    """Returns ``(brand, name, current, former, discount, badge)`` display strings from the sample rows."""
+    if site == 'framesdirect':
+        with open(os.path.join(FIXTURES_DIR, 'framesdirect_rows.csv'), newline='', encoding='utf-8') as csv_file:
+            rows = list(csv.DictReader(csv_file))
+    else:
+        with open(os.path.join(FIXTURES_DIR, 'glasses_rows.json'), encoding='utf-8') as json_file:
+            rows = json.load(json_file)
+
+    samples = []
+    for row in rows:
+        if 'current_price_cents' in row:
+            # Files written since the switch to ProductRecord
+            samples.append((
+                row['brand'] or '', row['name'] or '',
+                _cents_to_text(row['current_price_cents']), _cents_to_text(row['former_price_cents']),
+                f"{row['discount_pct']}% Off" if row['discount_pct'] not in (None, '') else '',
+                row.get('first_badge') or '',
+            ))
+        elif site == 'framesdirect':
+            samples.append((row['brand'], row['name'], row['current_price'], row['former_price'], row['discount'], ''))
+        else:
+            samples.append((
+                row['Brand'], row['Name'], row['Current Price'], row['Former Price'],
+                row['Discount Percentage'], row['First Book Status'],
+            ))
+    return samples
+
+
+def product_slug(brand, name):
+    """URL slug of a sample product's page."""
+    return re.sub(r'[^a-z0-9]+', '-', f"{brand} {name}".lower()).strip('-')
+
+
+def _framesdirect_tile(slug, brand, name, current, former, discount, badge):
+    discount_html = f'<div class="frame-discount">{discount}</div>' if discount and discount != 'N/A' else ''
+    return (
+        '<div class="col-6 col-md-4"><div class="prod-holder">'
+        f'<a class="prod-img" href="/product/{slug}"><img src="/img.jpg" alt=""></a>'
+        f'<div class="prod-title"><div class="catalog-name">{brand}</div><div class="product_name">{name}</div></div>'
+        f'<div class="prod-price-wrap"><div class="prod-aslowas">{current}</div>'
+        f'<div class="prod-catalog-retail-price">{former}</div></div>'
+        f'{discount_html}</div></div>'
+    )
+
+
+def _glasses_tile(slug, brand, name, current, former, discount, badge):
+    badge_html = f'<div class="product-badge first-badge">{badge}</div>' if badge and badge != 'None' else ''
+    discount_html = (
+        f'<div class="product-badge discount-badge thirty">{discount}</div>' if discount and discount != 'None' else ''
+    )
+    current_html = f'<div class="product-offer-price">{current}</div>' if current and current != 'None' else ''
+    return (
+        f'<a class="product-tile" href="/gl-us/product/{slug}">'
+        f'<div class="product-top">{badge_html}</div>{discount_html}'
+        '<div class="product-image"><img src="/img.jpg" alt=""></div>'
+        f'<div class="product-info"><div class="product-brand">{brand}</div><div class="product-code">{name}</div>'
+        f'<div class="product-prices"><div class="product-list-price">{former}</div>{current_html}</div></div></a>'
+    )
+
+
+def listing_page(site, rows, page_number=1, last_page=True, base_url=None, page_count=None, fragment=False):
+    """Renders one listing page around the given sample rows.
+
+    ``base_url`` is used for glasses.com's absolute load-more URL, and
+    ``page_count`` adds framesdirect's numbered pagination links. A
+    ``fragment`` is just the tiles and the load-more element, as a
+    load-more request returns them.
+    """
+    tile = _framesdirect_tile if site == 'framesdirect' else _glasses_tile
+    tiles = ''.join(tile(product_slug(*row[:2]), *(html.escape(value) for value in row)) for row in rows)
+    # Page chrome the extractors skip, so partial parsing has something to skip too
+    chrome = '<header><nav>' + '<a class="nav-link" href="/x">Menu</a>' * 200 + '</nav></header>'
+    scripts = '<script>var analytics = {};</script>' * 20
+    if site == 'framesdirect':
+        pager = ''.join(f'<a href="/eyeglasses?&p={n}">{n}</a>' for n in range(1, (page_count or 0) + 1))
+        if not last_page:
+            pager += f'<a class="ml-1" href="/eyeglasses?&p={page_number + 1}">Next</a>'
+        body = f'<div class="fd-cat"><div class="row">{tiles}</div><div class="pagination">{pager}</div></div>'
+    else:
+        pager = '' if last_page else (
+            f'<div class="load-more-wrapper" data-filter-url="{base_url or "https://www.glasses.com"}/gl-us/eyeglasses?page={page_number + 1}"></div>'
+        )
+        if fragment:
+            return f'{tiles}{pager}'
+        body = f'<div class="catalog-page"><div class="product-grid">{tiles}</div>{pager}</div>'
+    return f'<!DOCTYPE html><html><head><title>Eyeglasses</title>{scripts}</head><body>{chrome}{body}</body></html>'
+
+
+def detail_page(site, slug):
+    """Renders a product page for ``slug``: glasses.com's carries JSON-LD, framesdirect's only markup."""
+    digest = hashlib.sha1(slug.encode('utf-8')).hexdigest()
+    sku = f"{digest[:3].upper()}{int(digest[3:8], 16) % 9000 + 1000}"
+    size = f"{48 + int(digest[8], 16) % 8}-{16 + int(digest[9], 16) % 5}-140"
+    material = ('Acetate', 'Metal', 'Titanium', 'Nylon')[int(digest[10], 16) % 4]
+    colors = ['Black', 'Tortoise', 'Gold', 'Crystal', 'Blue'][:1 + int(digest[11], 16) % 4]
+    chrome = '<header><nav>' + '<a class="nav-link" href="/x">Menu</a>' * 100 + '</nav></header>'
+    if site == 'glasses':
+        data = {
+            '@context': 'https://schema.org', '@type': 'Product', 'name': slug, 'sku': sku, 'material': material,
+            'additionalProperty': [{'@type': 'PropertyValue', 'name': 'Frame Size', 'value': size}],
+            'hasVariant': [{'@type': 'Product', 'sku': f"{sku}-{n}", 'color': color} for n, color in enumerate(colors)],
+        }
+        body = (
+            f'<div class="pdp-main"><h1>{slug}</h1>'
+            f'<script type="application/ld+json">{json.dumps(data)}</script></div>'
+        )
+    else:
+        swatches = ''.join(f'<a class="swatch" title="{color}" href="#"></a>' for color in colors)
+        body = (
+            f'<div class="pdp-container"><div class="product-info"><h1>{slug}</h1>'
+            f'<span class="product-sku">{sku}</span></div>'
+            f'<div class="frame-specs"><div class="frame-size">{size}</div><div class="frame-material">{material}</div></div>'
+            f'<div class="color-swatches">{swatches}</div></div>'
+        )
+    return f'<!DOCTYPE html><html><head><title>{slug}</title></head><body>{chrome}{body}</body></html>'
+
+
+def catalog_rows(site, start, stop):
+    """Sample rows for catalog positions ``start`` to ``stop``, with names made unique."""
+    samples = sample_rows(site)
+    rows = []
+    for offset in range(start, stop):
+        brand, name, *rest = samples[offset % len(samples)]
+        # Keep names unique so dedup sees a realistic catalog
+        rows.append((brand, f"{name} #{offset}", *rest))
+    return rows
+
+
+def synthetic_catalog(site, tiles, page_size=60):
+    """Yields listing pages for a catalog of ``tiles`` products built from the sample rows."""
+    page_count = (tiles + page_size - 1) // page_size
+    for page_index in range(page_count):
+        rows = catalog_rows(site, page_index * page_size, min(tiles, (page_index + 1) * page_size))
+        yield listing_page(site, rows, page_index + 1, last_page=page_index == page_count - 1)
+
+
+def load_more_catalog(tiles, page_size=60):
+    """Yields glasses.com pages as successive load-more clicks render them: each repeats every earlier tile."""
+    page_count = (tiles + page_size - 1) // page_size
+    for page_index in range(page_count):
+        rows = catalog_rows('glasses', 0, min(tiles, (page_index + 1) * page_size))
+        yield listing_page('glasses', rows, page_index + 1, last_page=page_index == page_count - 1)
+
+
+def vendor_catalogs(tiles):
+    """Two vendors' product dicts for ``tiles`` products each, half of them carried by both.
+
+    Brands and model words come from the sample rows; model numbers are
+    made unique per position so matching has as many distinct codes to tell
+    apart as a real catalog.
+    """
+    samples = sample_rows('framesdirect')
+    left, right = [], []
+    for offset in range(tiles):
+        brand, name = samples[offset % len(samples)][:2]
+        prefix = ''.join(word[0] for word in brand.split()[:2]).upper()
+        words = ' '.join(word for word in name.split() if not any(char.isdigit() for char in word))
+
+        def code(odd):
+            position = 2 * offset + odd
+            return f"{prefix}{10000 + position % 90000}{chr(65 + position // 90000)}"
+
+        price = 5000 + offset % 400 * 100
+        left.append({'site': 'framesdirect', 'brand': brand, 'name': f"{code(0)} {words}".strip(), 'current_price_cents': price})
+        # Every other glasses.com product is one framesdirect does not carry
+        shared = offset % 2 == 0
+        right.append({
+            'site': 'glasses', 'brand': brand, 'name': f"{code(0 if shared else 1)} {words} Optics".strip(),
+            'current_price_cents': price + 500,
+        })
+    return left, right
+
+
+def recorded_pages(site):
+    """Yields the recorded fixture pages for ``site`` (empty if none were exported)."""
+    directory = os.path.join(FIXTURES_DIR, site)
+    if not os.path.isdir(directory):
+        return
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.html.gz'):
+            with gzip.open(os.path.join(directory, filename), 'rb') as fixture_file:
+                yield fixture_file.read().decode('utf-8')
+
+
+def export_from_cache(cache_dir, crawl_id, site):
+    """Copies the pages of a cached crawl into ``benchmarks/fixtures/<site>/``."""
+    from snapshot_cache import SnapshotCache
+
+    cache = SnapshotCache(cache_dir)
+    if crawl_id == 'latest':
+        crawl_id = cache.latest_crawl_id(f"{site}-")
+    directory = os.path.join(FIXTURES_DIR, site)
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for index, (url, html_source) in enumerate(cache.iter_crawl(crawl_id)):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]
+        with gzip.open(os.path.join(directory, f"{index:04d}-{digest}.html.gz"), 'wb') as fixture_file:
+            fixture_file.write(html_source.encode('utf-8'))
+        count += 1
+    cache.close()
+    print(f"Exported {count} pages of {crawl_id} to {directory}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export cached pages as benchmark fixtures")
+    parser.add_argument('--site', choices=SITES, required=True)
+    parser.add_argument('--crawl-id', default='latest')
+    parser.add_argument('--cache-dir', default='./snapshot_cache')
+    args = parser.parse_args()
+    export_from_cache(args.cache_dir, args.crawl_id, args.site)
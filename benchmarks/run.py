@@ -0,0 +1,259 @@
+"""Offline benchmarks for extraction, dedup and saving.
+
+Runs entirely on local fixtures (no network, no Chrome)::
+
+    python -m benchmarks.run                     # compare against benchmarks/baseline.json
+    python -m benchmarks.run --tiles 100000      # catalog-scale run (slow)
+    python -m benchmarks.run --save-baseline     # record this machine's numbers
+
+Each benchmark reports throughput (items/s) and peak Python heap (via
+tracemalloc, measured in a separate pass so it does not skew the timing).
+A benchmark whose throughput falls more than ``--threshold`` below the
+baseline is reported as a regression and the run exits non-zero.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+
+import framesdirect_pag
+import glasses_pag
+import page_pipeline
+import product_matching
+from dedup_store import DedupStore
+from pipeline import dedup_records
+from sinks import StreamingSink
+
+from benchmarks.fixtures import SITES, load_more_catalog, recorded_pages, synthetic_catalog, vendor_catalogs
+
+BASELINE_FILENAME = os.path.join(os.path.dirname(__file__), 'baseline.json')
+SCRAPERS = {'framesdirect': framesdirect_pag, 'glasses': glasses_pag}
+
+
+def available_backends():
+    """Parser backends whose libraries are installed here."""
+    modules = {'lxml': 'lxml', 'html5lib': 'html5lib', 'selectolax': 'selectolax'}
+    backends = []
+    for backend in page_pipeline.PARSER_BACKENDS:
+        module = modules.get(backend)
+        if module is not None:
+            try:
+                __import__(module)
+            except ImportError:
+                continue
+        backends.append(backend)
+    return backends
+
+
+def measure(function, items):
+    """Times ``function()`` and then measures its peak heap in a second run."""
+    gc.collect()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'items': items,
+        'seconds': round(seconds, 4),
+        'items_per_second': round(items / max(seconds, 1e-9), 1),
+        'peak_mb': round(peak / 2**20, 2),
+    }
+
+
+def extract_all(scraper, pages, backend, parse_only):
+    records = []
+    for html_source in pages:
+        records.extend(page_pipeline.process_page(
+            html_source, scraper.extract_product_data, scraper.find_next_url, backend, parse_only
+        ).products)
+    return records
+
+
+def extract_load_more(pages, incremental):
+    """Extracts a load-more chain, either re-parsing every page or only the tiles past the high-water mark."""
+    records = []
+    for html_source in pages:
+        high_water = len(records) if incremental else 0
+        records.extend(glasses_pag.process_page(html_source, high_water=high_water).products)
+    return records
+
+
+def all_pairs_match(left, right, threshold=0.5):
+    # The naive join: score every product of one vendor against every product of the other
+    matches = []
+    for item in left:
+        score, best = max(((product_matching.similarity(item, other), other) for other in right), key=lambda pair: pair[0])
+        if score >= threshold:
+            matches.append((score, item, best))
+    return matches
+
+
+def legacy_dedup(records):
+    # What the scrapers did before the streaming sink: a set of row tuples
+    return list({tuple(record.to_dict().values()) for record in records})
+
+
+def store_dedup(pages_of_records):
+    with tempfile.TemporaryDirectory() as directory:
+        store = DedupStore(os.path.join(directory, 'dedup.sqlite'))
+        for records in pages_of_records:
+            store.classify_page(records, 'benchmark')
+        store.close()
+
+
+def legacy_save(scraper, records):
+    with tempfile.TemporaryDirectory() as directory:
+        scraper.save_data_to_files(
+            records, os.path.join(directory, 'data.json'), os.path.join(directory, 'data.csv')
+        )
+
+
+def streaming_save(pages_of_records):
+    with tempfile.TemporaryDirectory() as directory:
+        sink = StreamingSink(os.path.join(directory, 'data'))
+        for records in pages_of_records:
+            sink.write_page(records)
+        sink.close()
+
+
+def quietly(function):
+    """Runs ``function`` with the scrapers' progress prints silenced."""
+    def run():
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            function()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    return run
+
+
+def run_benchmarks(sites, tiles, backends, use_recorded=False):
+    results = {}
+    for site in sites:
+        scraper = SCRAPERS[site]
+        pages = list(recorded_pages(site)) if use_recorded else list(synthetic_catalog(site, tiles))
+        if not pages:
+            print(f"No recorded fixtures for {site}, skipping.")
+            continue
+        records = extract_all(scraper, pages, 'html.parser', scraper.PARSE_ONLY)
+        pages_of_records = [
+            extract_all(scraper, [html_source], 'html.parser', scraper.PARSE_ONLY) for html_source in pages
+        ]
+        print(f"{site}: {len(pages)} pages, {len(records)} products")
+
+        for backend in backends:
+            variants = [('full', None)]
+            if backend in page_pipeline.BS4_BACKENDS:
+                variants.append(('strained', scraper.PARSE_ONLY))
+            for variant, parse_only in variants:
+                name = f"{site}/extract/{backend}/{variant}"
+                results[name] = measure(partial(extract_all, scraper, pages, backend, parse_only), len(records))
+                print(format_result(name, results[name]))
+
+        for name, function in (
+            ('dedup/legacy-set', partial(legacy_dedup, records)),
+            ('dedup/record-hash', lambda: list(dedup_records(records))),
+            ('dedup/sqlite-store', partial(store_dedup, pages_of_records)),
+            ('save/legacy-rewrite', quietly(partial(legacy_save, scraper, records))),
+            ('save/streaming-sink', quietly(partial(streaming_save, pages_of_records))),
+        ):
+            name = f"{site}/{name}"
+            results[name] = measure(function, len(records))
+            print(format_result(name, results[name]))
+
+        if site == 'glasses' and not use_recorded:
+            # Cumulative pages grow quadratically, so this chain is capped
+            chain = list(load_more_catalog(min(tiles, 1200)))
+            for variant, incremental in (('reparse', False), ('high-water', True)):
+                name = f"glasses/load-more/{variant}"
+                results[name] = measure(partial(extract_load_more, chain, incremental), min(tiles, 1200))
+                print(format_result(name, results[name]))
+
+    if not use_recorded:
+        left, right = vendor_catalogs(tiles)
+        left = [product_matching.match_item(record) for record in left]
+        right = [product_matching.match_item(record) for record in right]
+        # All pairs is quadratic, so it only gets a slice of the catalog
+        capped = min(tiles, 1000)
+        for name, function, items in (
+            ('match/all-pairs', partial(all_pairs_match, left[:capped], right[:capped]), capped),
+            ('match/blocked-index', partial(product_matching.match_products, left, right), tiles),
+        ):
+            results[name] = measure(function, items)
+            print(format_result(name, results[name]))
+    return results
+
+
+def format_result(name, result):
+    return f"  {name:<45} {result['items_per_second']:>12,.0f} items/s {result['peak_mb']:>9.2f} MB peak"
+
+
+def compare(results, baseline, threshold):
+    """Returns the names of benchmarks that got more than ``threshold`` slower than the baseline."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None:
+            continue
+        change = result['items_per_second'] / reference['items_per_second'] - 1
+        marker = ''
+        if change < -threshold:
+            regressions.append(name)
+            marker = '  REGRESSION'
+        print(f"  {name:<45} {change:+8.1%} vs baseline{marker}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline scraper benchmarks")
+    parser.add_argument('--site', choices=SITES, action='append', help="Site to benchmark (repeatable, default: both)")
+    parser.add_argument('--tiles', type=int, default=5000, help="Products per synthetic catalog")
+    parser.add_argument('--parser', choices=page_pipeline.PARSER_BACKENDS, action='append',
+                        help="Parser backend to benchmark (repeatable, default: every installed one)")
+    parser.add_argument('--recorded', action='store_true', help="Use the pages in benchmarks/fixtures/ instead of synthetic ones")
+    parser.add_argument('--baseline', default=BASELINE_FILENAME)
+    parser.add_argument('--save-baseline', action='store_true', help="Write this run's results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed throughput drop before flagging a regression")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.site or SITES, args.tiles, args.parser or available_backends(), args.recorded)
+    report = {
+        'tiles': args.tiles,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=4)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=4)
+        print(f"Baseline saved to {args.baseline}.")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('tiles') != args.tiles:
+            print(f"Note: baseline was recorded with --tiles {baseline.get('tiles')}, this run used {args.tiles}.")
+        print("Compared with baseline:")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}.")
+            sys.exit(1)
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
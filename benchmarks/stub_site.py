@@ -0,0 +1,229 @@
+"""Local stand-in for the vendor sites, with configurable throttling.
+
+Serves synthetic framesdirect (``/eyeglasses?p=N``) and glasses.com
+(``/gl-us/eyeglasses?page=N``) listing pages, and can misbehave the way a
+busy or defensive site does, to exercise the adaptive rate control::
+
+    python -m benchmarks.stub_site --port 8800 --rate-limit 5 --max-concurrent 2 --slow-every 10
+    python framesdirect_pag.py --fetch http --base-url http://127.0.0.1:8800 --no-cache
+
+With ``--load-more`` glasses.com pages repeat every earlier tile, and a
+request carrying ``X-Requested-With`` gets only the appended tiles, like
+the live site's load-more button. ``--etag`` answers conditional requests
+with 304s, and ``--change-pages`` reprices some pages, to exercise
+``--skip-unchanged`` and ``--sample`` between two runs. Every tile links to
+a product page (``/product/<slug>``, ``/gl-us/product/<slug>``) for
+``--details``.
+
+Ctrl+C prints a summary of the responses served.
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.fixtures import catalog_rows, detail_page, listing_page
+
+BLOCK_PAGE = (
+    '<html><head><title>Access Denied</title></head><body>'
+    '<div id="px-captcha">Please verify you are a human</div></body></html>'
+)
+
+
+class StubBehaviour:
+    """Decides how each request is answered; shared by all handler threads."""
+
+    def __init__(self, tiles=600, page_size=60, latency=0.05, jitter=0.0, rate_limit=None, max_concurrent=None,
+                 slow_every=None, slow_latency=8.0, fail_rate=0.0, block_after=None, block_for=20, retry_after=1,
+                 load_more=False, etag=False, change_pages=()):
+        self.tiles = tiles
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.max_concurrent = max_concurrent
+        self.slow_every = slow_every
+        self.slow_latency = slow_latency
+        self.fail_rate = fail_rate
+        self.block_after = block_after
+        self.block_for = block_for
+        self.retry_after = retry_after
+        self.load_more = load_more
+        self.etag = etag
+        self.change_pages = set(change_pages)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.tokens = float(rate_limit or 0)
+        self.refilled_at = time.monotonic()
+        self.served = Counter()
+
+    def _take_token(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate_limit, self.tokens + (now - self.refilled_at) * self.rate_limit)
+        self.refilled_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def admit(self):
+        """Returns ``(kind, delay)``: kind is 'page', 'throttled', 'error' or 'blocked'."""
+        with self.lock:
+            self.requests += 1
+            number = self.requests
+            if (self.max_concurrent is not None and self.in_flight >= self.max_concurrent) or (
+                    self.rate_limit and not self._take_token()):
+                self.served[429] += 1
+                return 'throttled', 0
+            self.in_flight += 1
+        if self.block_after is not None and self.block_after < number <= self.block_after + self.block_for:
+            kind = 'blocked'
+        elif random.random() < self.fail_rate:
+            kind = 'error'
+        else:
+            kind = 'page'
+        delay = self.latency + random.uniform(0, self.jitter)
+        if self.slow_every and number % self.slow_every == 0:
+            delay = self.slow_latency
+        return kind, delay
+
+    def done(self, status):
+        with self.lock:
+            self.in_flight -= 1
+            self.served[status] += 1
+
+    def page(self, site, page_number, base_url, fragment=False):
+        page_count = max(1, -(-self.tiles // self.page_size))
+        if page_number > page_count:
+            return None
+        first = (page_number - 1) * self.page_size
+        if site == 'glasses' and self.load_more and not fragment:
+            first = 0
+        rows = catalog_rows(site, first, min(self.tiles, page_number * self.page_size))
+        if page_number in self.change_pages:
+            rows = [(brand, name, '$9.99', *rest) for brand, name, _, *rest in rows]
+        return listing_page(
+            site, rows, page_number, last_page=page_number == page_count, base_url=base_url,
+            page_count=page_count if site == 'framesdirect' else None,
+            fragment=site == 'glasses' and self.load_more and fragment,
+        )
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    behaviour = None
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        product = None
+        if parts.path == '/eyeglasses':
+            site, page_number = 'framesdirect', query.get('p', ['1'])[0]
+        elif parts.path == '/gl-us/eyeglasses':
+            site, page_number = 'glasses', query.get('page', ['1'])[0]
+        elif parts.path.startswith(('/product/', '/gl-us/product/')):
+            site, page_number = 'glasses' if parts.path.startswith('/gl-us/') else 'framesdirect', '1'
+            product = parts.path.rsplit('/', 1)[-1]
+        else:
+            self._send(404, b'not found')
+            return
+
+        kind, delay = self.behaviour.admit()
+        if kind == 'throttled':
+            self._send(429, b'Too Many Requests', {'Retry-After': str(self.behaviour.retry_after)})
+            return
+        status = 200
+        try:
+            time.sleep(delay)
+            if kind == 'error':
+                status = 500
+                self._send(500, b'Internal Server Error')
+            elif kind == 'blocked':
+                self._send(200, BLOCK_PAGE.encode('utf-8'))
+                status = 'blocked'
+            else:
+                if product is not None:
+                    body = detail_page(site, product)
+                else:
+                    body = self.behaviour.page(site, int(page_number) if page_number.isdigit() else 1,
+                                               f"http://{self.headers.get('Host')}",
+                                               fragment=self.headers.get('X-Requested-With') == 'XMLHttpRequest')
+                if body is None:
+                    status = 404
+                    self._send(404, b'not found')
+                elif self.behaviour.etag:
+                    etag = f'"{hashlib.sha1(body.encode("utf-8")).hexdigest()}"'
+                    if self.headers.get('If-None-Match') == etag:
+                        status = 304
+                        self._send(304, b'', {'ETag': etag})
+                    else:
+                        self._send(200, body.encode('utf-8'), {'ETag': etag})
+                else:
+                    self._send(200, body.encode('utf-8'))
+        finally:
+            self.behaviour.done(status)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, behaviour, host='127.0.0.1'):
+    """Starts the stub server in a background thread and returns it (call ``shutdown()`` to stop)."""
+    handler = type('BoundStubHandler', (StubHandler,), {'behaviour': behaviour})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic listing pages with simulated throttling")
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--tiles', type=int, default=600, help="Products per site")
+    parser.add_argument('--page-size', type=int, default=60)
+    parser.add_argument('--latency', type=float, default=0.05, help="Base response time in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra random response time, up to this many seconds")
+    parser.add_argument('--rate-limit', type=float, help="Requests per second before answering 429")
+    parser.add_argument('--max-concurrent', type=int, help="Requests in flight before answering 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--slow-every', type=int, help="Make every Nth request slow")
+    parser.add_argument('--slow-latency', type=float, default=8.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument('--block-after', type=int, help="Serve a captcha page after this many requests")
+    parser.add_argument('--block-for', type=int, default=20, help="...for this many requests")
+    parser.add_argument('--load-more', action='store_true',
+                        help="Serve glasses.com pages cumulatively, with fragments for load-more requests")
+    parser.add_argument('--etag', action='store_true', help="Send ETags and answer matching If-None-Match with 304")
+    parser.add_argument('--change-pages', default='', help="Comma-separated page numbers served with changed prices")
+    args = parser.parse_args()
+
+    behaviour = StubBehaviour(
+        tiles=args.tiles, page_size=args.page_size, latency=args.latency, jitter=args.jitter,
+        rate_limit=args.rate_limit, max_concurrent=args.max_concurrent, slow_every=args.slow_every,
+        slow_latency=args.slow_latency, fail_rate=args.fail_rate, block_after=args.block_after,
+        block_for=args.block_for, retry_after=args.retry_after, load_more=args.load_more,
+        etag=args.etag, change_pages=[int(n) for n in args.change_pages.split(',') if n],
+    )
+    server = serve(args.port, behaviour)
+    print(f"Stub site on http://127.0.0.1:{args.port} (framesdirect: /eyeglasses?, glasses: /gl-us/eyeglasses?)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Served {behaviour.requests} requests: {dict(behaviour.served)}")
@@ -0,0 +1,101 @@
+import glob
+import os
+import time
+from dataclasses import fields
+
+from product_record import ProductRecord
+from sinks import to_row
+
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Columnar output requires the pyarrow package") from e
+    return pyarrow
+
+
+def product_schema():
+    """Arrow schema matching ProductRecord, minus ``site`` which lives in the partition path."""
+    pa = _pyarrow()
+    types = {
+        'current_price_cents': pa.int64(),
+        'former_price_cents': pa.int64(),
+        'discount_pct': pa.float64(),
+    }
+    return pa.schema([
+        (field.name, types.get(field.name, pa.string())) for field in fields(ProductRecord) if field.name != 'site'
+    ])
+
+
+class ColumnarSink:
+    """Writes records as Parquet row groups or Arrow IPC record batches while the crawl streams.
+
+    Files are partitioned hive-style as
+    ``<root>/site=<site>/crawl_date=<YYYY-MM-DD>/<crawl_id>-<start>.<ext>``.
+    Rows are buffered and flushed every ``row_group_size`` rows.
+    """
+
+    def __init__(self, root, site, crawl_id, fmt='parquet', row_group_size=10000, crawl_date=None):
+        if fmt not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unknown columnar format {fmt!r}, expected one of {COLUMNAR_FORMATS}")
+        pa = _pyarrow()
+        self.fmt = fmt
+        self.row_group_size = row_group_size
+        self.schema = product_schema()
+        self.buffer = []
+
+        crawl_date = crawl_date or time.strftime('%Y-%m-%d')
+        directory = os.path.join(root, f"site={site}", f"crawl_date={crawl_date}")
+        os.makedirs(directory, exist_ok=True)
+        extension = 'parquet' if fmt == 'parquet' else 'arrow'
+        # A resumed crawl starts a new part instead of overwriting the earlier one
+        self.path = os.path.join(directory, f"{crawl_id}-{int(time.time())}.{extension}")
+
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(self.path, self.schema)
+
+    def write_page(self, records):
+        self.buffer.extend(to_row(record) for record in records)
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        pa = _pyarrow()
+        table = pa.Table.from_pylist(self.buffer, schema=self.schema)
+        if self.fmt == 'parquet':
+            self.writer.write_table(table, row_group_size=self.row_group_size)
+        else:
+            for batch in table.to_batches(max_chunksize=self.row_group_size):
+                self.writer.write_batch(batch)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        print(f"Data successfully saved to {self.path}.")
+
+
+def read_arrow(path):
+    """Reads an Arrow IPC file through a memory map, so loading is close to free."""
+    pa = _pyarrow()
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def load_dataset(root, fmt='parquet'):
+    """Opens every partition under ``root`` as one pyarrow dataset (site and crawl_date become columns)."""
+    _pyarrow()
+    import pyarrow.dataset as ds
+    extension = 'parquet' if fmt == 'parquet' else 'arrow'
+    paths = sorted(glob.glob(os.path.join(root, '**', f"*.{extension}"), recursive=True))
+    return ds.dataset(
+        paths, format='ipc' if fmt == 'arrow' else 'parquet', partitioning='hive', partition_base_dir=root
+    )
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, write_to_textfile
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60)
+
+
+class CrawlMetrics:
+    """Per-stage timings, counters and browser memory for one crawl.
+
+    Every event is appended to a JSON Lines log, and the aggregated
+    histograms/counters are written in Prometheus text format (for the
+    node_exporter textfile collector) every ``export_every`` pages and at
+    the end of the crawl.
+    """
+
+    def __init__(self, site, metrics_dir='./metrics', export_every=10):
+        self.site = site
+        self.export_every = export_every
+        self.started = time.monotonic()
+        self.pages = 0
+        self.rows = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.prom_filename = os.path.join(metrics_dir, f"{site}.prom")
+        self.log_file = open(os.path.join(metrics_dir, f"{site}_events.jsonl"), 'a', encoding='utf-8')
+
+        self.registry = CollectorRegistry()
+        self.stage_seconds = Histogram(
+            'scraper_stage_seconds', "Time spent in each crawl stage", ['site', 'stage'],
+            buckets=STAGE_BUCKETS, registry=self.registry,
+        )
+        self.pages_total = Counter('scraper_pages', "Pages extracted", ['site', 'backend'], registry=self.registry)
+        self.rows_total = Counter('scraper_rows', "Product rows extracted", ['site'], registry=self.registry)
+        self.errors_total = Counter('scraper_errors', "Fetch errors by kind", ['site', 'kind'], registry=self.registry)
+        self.pages_per_minute = Gauge('scraper_pages_per_minute', "Crawl rate in pages/min", ['site'], registry=self.registry)
+        self.rows_per_minute = Gauge('scraper_rows_per_minute', "Crawl rate in rows/min", ['site'], registry=self.registry)
+        self.browser_rss = Gauge('scraper_browser_rss_bytes', "Resident memory of the browser processes", ['site'], registry=self.registry)
+
+    def log(self, event, **fields):
+        entry = {'ts': time.time(), 'site': self.site, 'event': event, **fields}
+        with self.lock:
+            self.log_file.write(json.dumps(entry) + '\n')
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        """Records a stage timed elsewhere (e.g. in a worker process)."""
+        self.stage_seconds.labels(self.site, name).observe(seconds)
+        self.log('stage', stage=name, seconds=round(seconds, 6))
+
+    def error(self, kind, url=None, message=None):
+        self.errors_total.labels(self.site, kind).inc()
+        self.log('error', kind=kind, url=url, message=message)
+
+    def page_done(self, url, backend, rows):
+        self.pages_total.labels(self.site, backend or 'unknown').inc()
+        self.rows_total.labels(self.site).inc(rows)
+        with self.lock:
+            self.pages += 1
+            self.rows += rows
+            pages = self.pages
+        self.log('page', url=url, backend=backend, rows=rows)
+        if pages % self.export_every == 0:
+            self.export()
+
+    def sample_browser_rss(self):
+        """Sums the RSS of this process's child processes (chromedriver and Chrome)."""
+        rss = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                continue
+        self.browser_rss.labels(self.site).set(rss)
+        return rss
+
+    def export(self):
+        """Updates the rate gauges and rewrites the Prometheus text file."""
+        minutes = max(time.monotonic() - self.started, 1e-9) / 60
+        self.pages_per_minute.labels(self.site).set(self.pages / minutes)
+        self.rows_per_minute.labels(self.site).set(self.rows / minutes)
+        self.sample_browser_rss()
+        write_to_textfile(self.prom_filename, self.registry)
+
+    def close(self):
+        self.export()
+        self.log_file.close()
+        print(f"Metrics saved to {self.prom_filename}.")
+
+
+# The crawl being measured; the helpers below are no-ops when none is active
+_active = None
+
+
+def activate(metrics):
+    global _active
+    _active = metrics
+
+
+@contextmanager
+def stage(name):
+    """Times a block as crawl stage ``name`` on the active metrics, if any."""
+    if _active is None:
+        yield
+        return
+    with _active.stage(name):
+        yield
+
+
+def observe(name, seconds):
+    if _active is not None:
+        _active.observe(name, seconds)
+
+
+def error(kind, url=None, message=None):
+    if _active is not None:
+        _active.error(kind, url=url, message=message)
+
+
+def page_done(url, backend, rows):
+    if _active is not None:
+        _active.page_done(url, backend, rows)
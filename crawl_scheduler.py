@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import InvalidSessionIdException, WebDriverException
+
+import crawl_metrics
+from rate_control import HostBlocked, classify_exception
+
+# WebDriver errors after which the browser session is gone for good
+SESSION_ERRORS = ('invalid session id', 'session deleted', 'chrome not reachable', 'disconnected', 'no such window')
+
+
+def is_session_error(error):
+    """True if ``error`` means the driver's browser session died (crashed or closed Chrome)."""
+    if isinstance(error, (InvalidSessionIdException, ConnectionError)):
+        return True
+    return isinstance(error, WebDriverException) and any(text in str(error).lower() for text in SESSION_ERRORS)
+
+
+class WebDriverPool:
+    """Bounded pool of reusable WebDriver instances.
+
+    Drivers are created lazily with ``factory`` the first time they are needed,
+    so a crawl that turns out to be a single page only starts one browser.
+    A driver whose session dies while checked out is quit and its slot is
+    handed to the next caller, which starts a replacement.
+    """
+
+    def __init__(self, factory, size=2):
+        self.factory = factory
+        self.size = size
+        self.idle = queue.Queue()
+        self.created = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def driver(self):
+        """Checks out a driver for the duration of the block.
+
+        Raises whatever the factory raises when a browser cannot be started.
+        """
+        driver = self._acquire()
+        try:
+            yield driver
+        except Exception as e:
+            if is_session_error(e):
+                self.discard(driver)
+            else:
+                self.idle.put(driver)
+            raise
+        except BaseException:
+            self.idle.put(driver)
+            raise
+        else:
+            self.idle.put(driver)
+
+    def _acquire(self):
+        try:
+            driver = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_create = len(self.created) < self.size
+                if can_create:
+                    # Reserve the slot before the (slow) browser start
+                    self.created.append(None)
+            driver = None if can_create else self.idle.get()
+        if driver is not None:
+            return driver
+
+        # An empty slot, reserved above or freed by discard(): start its browser
+        try:
+            driver = self.factory()
+        except Exception:
+            # Leave the slot for the next caller (possibly one already waiting) to try again
+            self.idle.put(None)
+            raise
+        with self.lock:
+            self.created[self.created.index(None)] = driver
+        return driver
+
+    def discard(self, driver):
+        """Quits a driver whose session died and frees its slot for a new one."""
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self.lock:
+            self.created[self.created.index(driver)] = None
+        self.idle.put(None)
+
+    def close(self):
+        """Quits every driver the pool started."""
+        for driver in self.created:
+            if driver is not None:
+                driver.quit()
+        self.created = []
+
+
+class HostLimiter:
+    """Caps concurrent requests per host and spaces out their start times."""
+
+    def __init__(self, max_per_host=2, delay=1.0):
+        self.max_per_host = max_per_host
+        self.delay = delay
+        self.semaphores = {}
+        self.next_start = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            semaphore = self.semaphores.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+
+        with semaphore:
+            with self.lock:
+                now = time.monotonic()
+                start_at = max(now, self.next_start.get(host, now))
+                self.next_start[host] = start_at + self.delay
+            if start_at > now:
+                time.sleep(start_at - now)
+            yield
+
+
+class CrawlScheduler:
+    """Spreads page URLs over a WebDriver pool while respecting per-host limits.
+
+    ``fetch_page(driver, url)`` does the actual load and returns whatever the
+    caller needs (usually the page source). Failures are reported and yield
+    ``None`` so one bad page does not stop the crawl.
+
+    ``limiter`` paces the requests per host; by default a fixed HostLimiter.
+    A rate_control.RateController is also told how each load went (latency,
+    timeout, bot wall) so it can adapt.
+    """
+
+    def __init__(self, pool, fetch_page, max_per_host=2, delay=1.0, limiter=None):
+        self.pool = pool
+        self.fetch_page = fetch_page
+        self.limiter = limiter or HostLimiter(max_per_host=max_per_host, delay=delay)
+        self.record = getattr(self.limiter, 'record', None)
+        self.cancel_probe = getattr(self.limiter, 'cancel_probe', None)
+
+    def _fetch(self, url):
+        try:
+            with self.limiter.slot(url):
+                started = None
+                try:
+                    with self.pool.driver() as driver:
+                        started = time.monotonic()
+                        result = self.fetch_page(driver, url)
+                except Exception as e:
+                    # A browser that failed to start says nothing about the host, so only page loads are recorded
+                    if self.record is not None and started is not None:
+                        self.record(url, classify_exception(e), time.monotonic() - started)
+                    elif self.cancel_probe is not None:
+                        # ...but a half-open circuit must not wait forever for this request's outcome
+                        self.cancel_probe(url)
+                    print(f"Error fetching {url}: {e}")
+                    crawl_metrics.error(type(e).__name__, url, str(e))
+                    return url, None
+                if self.record is not None:
+                    self.record(url, 'ok', time.monotonic() - started)
+                return url, result
+        except HostBlocked as e:
+            print(f"Not fetching {url}: {e}")
+            crawl_metrics.error(type(e).__name__, url, str(e))
+            return url, None
+
+    def crawl(self, urls):
+        """Fetches the URLs concurrently and yields ``(url, result)`` in input order."""
+        with ThreadPoolExecutor(max_workers=self.pool.size) as executor:
+            yield from executor.map(self._fetch, urls)
@@ -0,0 +1,88 @@
+import json
+import os
+
+
+class CrawlState:
+    """Persisted crawl position used by ``--resume``.
+
+    Holds the frontier of URLs still to fetch, the URLs already done, the last
+    pagination cursor and the sink file offsets after the last completed page.
+    For a load-more chain it also keeps the high-water mark (tiles already
+    extracted) of each pending URL, so a resumed crawl only parses new tiles.
+    It is rewritten atomically after every page.
+    """
+
+    def __init__(self, path, crawl_id, pending=None, completed=None, cursor=None,
+                 offsets=None, total_products=0, fanned_out=False, high_water=None):
+        self.path = path
+        self.crawl_id = crawl_id
+        self.pending = list(pending or [])
+        self.completed = list(completed or [])
+        self.cursor = cursor
+        self.offsets = offsets or {}
+        self.total_products = total_products
+        self.fanned_out = fanned_out
+        self.high_water = dict(high_water or {})
+        self._completed_set = set(self.completed)
+
+    @classmethod
+    def load(cls, path):
+        """Returns the saved state, or None if there is no unfinished crawl."""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as state_file:
+            data = json.load(state_file)
+        return cls(path, **data)
+
+    def add_pending(self, urls):
+        """Adds URLs to the frontier, skipping ones already queued or done."""
+        queued = set(self.pending)
+        for url in urls:
+            if url not in queued and url not in self._completed_set:
+                self.pending.append(url)
+                queued.add(url)
+
+    def complete(self, url, next_urls, offsets, total_products, cursor=None, high_water=None):
+        """Marks a page as done, queues the pages it leads to and saves the state.
+
+        ``high_water`` maps queued URLs to their high-water marks.
+        """
+        if url in self.pending:
+            self.pending.remove(url)
+        self.high_water.pop(url, None)
+        if url not in self._completed_set:
+            self.completed.append(url)
+            self._completed_set.add(url)
+        self.add_pending(next_urls)
+        for next_url, mark in (high_water or {}).items():
+            if next_url in self.pending:
+                self.high_water[next_url] = mark
+        if cursor is not None:
+            self.cursor = cursor
+        self.offsets = offsets
+        self.total_products = total_products
+        self.save()
+
+    def save(self):
+        """Writes the state to a temporary file, fsyncs it and renames it into place."""
+        data = {
+            'crawl_id': self.crawl_id,
+            'pending': self.pending,
+            'completed': self.completed,
+            'cursor': self.cursor,
+            'offsets': self.offsets,
+            'total_products': self.total_products,
+            'fanned_out': self.fanned_out,
+            'high_water': self.high_water,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as state_file:
+            json.dump(data, state_file)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Removes the saved state once the crawl has finished."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,134 @@
+import hashlib
+import sqlite3
+import time
+from collections import Counter
+
+IDENTITY_FIELDS = ('site', 'brand', 'name')
+
+STATUSES = ('new', 'changed', 'unchanged')
+
+
+def identity_key(record, fields=IDENTITY_FIELDS):
+    """Hashes the identity fields of a record (ProductRecord or dict)."""
+    if isinstance(record, dict):
+        values = [record.get(field) for field in fields]
+    else:
+        values = [getattr(record, field, None) for field in fields]
+    payload = '\x1f'.join('' if value is None else str(value) for value in values)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def record_site(record):
+    return record.get('site') if isinstance(record, dict) else getattr(record, 'site', None)
+
+
+class DedupStore:
+    """Cross-run memory of products, keyed by identity, backed by SQLite.
+
+    Each record is classified against what the previous crawl saw as
+    ``new``, ``changed`` (same identity, different field values) or
+    ``unchanged``. Classification is done per page in one query and one
+    transaction, so a page costs O(its rows). Seeing the same record again
+    within a crawl (a duplicate tile, or a page redone after ``--resume``)
+    gives the same answer as the first time but is not counted twice, and
+    the digest stored for the next crawl stays the one first seen.
+    """
+
+    def __init__(self, path, identity_fields=IDENTITY_FIELDS):
+        self.identity_fields = tuple(identity_fields)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS records (
+                identity TEXT PRIMARY KEY,
+                site TEXT,
+                digest TEXT NOT NULL,
+                prev_digest TEXT,
+                first_seen_crawl TEXT NOT NULL,
+                last_seen_crawl TEXT NOT NULL,
+                last_seen_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS records_site_crawl ON records(site, last_seen_crawl);
+        """)
+        self.stats = Counter()
+
+    def key(self, record):
+        return identity_key(record, self.identity_fields)
+
+    def classify_page(self, records, crawl_id):
+        """Returns ``[(status, record), ...]`` in input order and records the page."""
+        keyed = [(self.key(record), record) for record in records]
+        known = {}
+        identities = list({identity for identity, _ in keyed})
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(identities), 500):
+            chunk = identities[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT identity, digest, prev_digest, first_seen_crawl, last_seen_crawl FROM records "
+                f"WHERE identity IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            known.update((row[0], row[1:]) for row in rows)
+
+        now = time.time()
+        results = []
+        for identity, record in keyed:
+            digest = record.digest() if hasattr(record, 'digest') else identity_key(record, sorted(record))
+            row = known.get(identity)
+            if row is None:
+                status = 'new'
+                row = (digest, None, crawl_id, crawl_id)
+            else:
+                current, previous, first_seen, last_seen = row
+                if last_seen == crawl_id:
+                    # A repeat: compare against what was known before this crawl started, and keep the
+                    # stored row (with the first-seen digest) as it is
+                    if first_seen == crawl_id and previous is None:
+                        status = 'new'
+                    else:
+                        status = 'unchanged' if previous == digest else 'changed'
+                    self.stats['duplicate'] += 1
+                    results.append((status, record))
+                    continue
+                status = 'unchanged' if current == digest else 'changed'
+                row = (digest, current, first_seen, crawl_id)
+            known[identity] = row
+            self.stats[status] += 1
+            results.append((status, record))
+            self.db.execute(
+                "INSERT OR REPLACE INTO records "
+                "(identity, site, digest, prev_digest, first_seen_crawl, last_seen_crawl, last_seen_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (identity, record_site(record), *row, now),
+            )
+        self.db.commit()
+        return results
+
+    def touch(self, identities, crawl_id):
+        """Marks products as seen unchanged in this crawl without re-classifying them (e.g. on a skipped page)."""
+        identities = list(identities)
+        now = time.time()
+        touched = 0
+        for start in range(0, len(identities), 500):
+            chunk = identities[start:start + 500]
+            touched += self.db.execute(
+                f"UPDATE records SET prev_digest = digest, last_seen_crawl = ?, last_seen_at = ? "
+                f"WHERE last_seen_crawl != ? AND identity IN ({','.join('?' * len(chunk))})",
+                (crawl_id, now, crawl_id, *chunk),
+            ).rowcount
+        self.db.commit()
+        self.stats['unchanged'] += touched
+        return touched
+
+    def missing(self, site, crawl_id):
+        """Number of known products of ``site`` that this crawl did not see."""
+        return self.db.execute(
+            "SELECT COUNT(*) FROM records WHERE site = ? AND last_seen_crawl != ?", (site, crawl_id)
+        ).fetchone()[0]
+
+    def report(self, site, crawl_id):
+        counts = ', '.join(f"{self.stats[status]} {status}" for status in STATUSES + ('duplicate',))
+        print(f"Crawl {crawl_id}: {counts}, {self.missing(site, crawl_id)} not seen this run.")
+
+    def close(self):
+        self.db.close()
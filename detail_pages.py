@@ -0,0 +1,309 @@
+"""Product detail pages: the second crawl stage.
+
+Every listing tile links to its product's page (``ProductRecord.url``),
+which shows what the tile does not: the SKU, frame size, material and
+colors. A catalog has one such page per product, some 30 times as many
+pages as the listing, so the DetailFetcher keeps a fixed number of
+requests in flight over one pooled HTTP client and never waits on a whole
+batch. A DetailStore remembers what each page yielded and its validators,
+so a page checked recently is not requested at all, and an older one is
+revalidated with a conditional request that an unchanged page answers
+with an empty 304. ``pipeline.enrich_pages`` merges the details into the
+listing records page by page, while the listing crawl goes on.
+"""
+import dataclasses
+import json
+import re
+import sqlite3
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import crawl_metrics
+import page_pipeline
+from fetch_backends import HttpFetcher, has_class
+
+DETAIL_FIELDS = ('sku', 'frame_size', 'material', 'colors')
+
+# What one product page yielded, with its validators and when it was last checked
+DetailEntry = namedtuple('DetailEntry', ['url', *DETAIL_FIELDS, 'etag', 'last_modified', 'checked_at'])
+
+LD_JSON_PATTERN = re.compile(
+    r'<script\b[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL
+)
+PRODUCT_TYPES = {'Product', 'ProductGroup', 'ProductModel'}
+# additionalProperty names that carry an attribute, e.g. {"name": "Frame Size", "value": "52-18-140"}
+PROPERTY_NAMES = (
+    ('frame_size', re.compile(r'size', re.IGNORECASE)),
+    ('material', re.compile(r'material', re.IGNORECASE)),
+    ('colors', re.compile(r'colou?r', re.IGNORECASE)),
+    ('sku', re.compile(r'\bsku\b|\bupc\b', re.IGNORECASE)),
+)
+
+
+def _products(data):
+    """Yields the schema.org Product objects in a JSON-LD document."""
+    if isinstance(data, list):
+        for item in data:
+            yield from _products(item)
+    elif isinstance(data, dict):
+        types = data.get('@type')
+        if not PRODUCT_TYPES.isdisjoint(types if isinstance(types, list) else [types]):
+            yield data
+        if '@graph' in data:
+            yield from _products(data['@graph'])
+
+
+def _scalar(value):
+    """Text of a JSON-LD value (a string, a number, a named object or the first of a list), or None."""
+    if isinstance(value, list):
+        value = next((item for item in value if item), None)
+    if isinstance(value, dict):
+        value = value.get('name') or value.get('value')
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    return str(value).strip() or None
+
+
+def _add_colors(colors, value):
+    for item in value if isinstance(value, list) else [value]:
+        color = _scalar(item)
+        if color and color not in colors:
+            colors.append(color)
+
+
+def structured_details(html_source):
+    """Reads the attributes from the page's JSON-LD Product data, including its variants."""
+    details, colors = {}, []
+    for block in LD_JSON_PATTERN.findall(html_source):
+        try:
+            data = json.loads(block.strip())
+        except ValueError:
+            continue
+        for product in _products(data):
+            variants = product.get('hasVariant') or []
+            for item in [product, *(variants if isinstance(variants, list) else [variants])]:
+                if not isinstance(item, dict):
+                    continue
+                details.setdefault('sku', _scalar(item.get('sku')) or _scalar(item.get('mpn')))
+                details.setdefault('material', _scalar(item.get('material')))
+                details.setdefault('frame_size', _scalar(item.get('size')))
+                _add_colors(colors, item.get('color'))
+                properties = item.get('additionalProperty') or []
+                for prop in properties if isinstance(properties, list) else [properties]:
+                    if not isinstance(prop, dict) or not isinstance(prop.get('name'), str):
+                        continue
+                    for name, pattern in PROPERTY_NAMES:
+                        if pattern.search(prop['name']):
+                            if name == 'colors':
+                                _add_colors(colors, prop.get('value'))
+                            elif not details.get(name):
+                                details[name] = _scalar(prop.get('value'))
+                            break
+    details = {name: value for name, value in details.items() if value}
+    if colors:
+        details['colors'] = ', '.join(colors)
+    return details
+
+
+def _label(element):
+    text = element.text.strip()
+    return text or (element.attrs.get('title') or element.attrs.get('aria-label') or '').strip()
+
+
+def extract_details(spec, html_source, backend="html.parser"):
+    """Returns ``{attribute: value}`` for every DETAIL_FIELDS attribute (None where the page has none).
+
+    The page is only parsed when its JSON-LD leaves an attribute that the
+    spec has a selector for.
+    """
+    details = structured_details(html_source)
+    missing = [
+        name for name in DETAIL_FIELDS
+        if name not in details and (name in spec.field_selectors or name in spec.list_selectors)
+    ]
+    if missing:
+        with crawl_metrics.stage('parse'):
+            soup = page_pipeline.parse_html(html_source, backend=backend, parse_only=spec.parse_only)
+        for name in missing:
+            if name in spec.list_selectors:
+                labels = list(dict.fromkeys(label for label in map(_label, spec.list_selectors[name].select(soup)) if label))
+                if labels:
+                    details[name] = ', '.join(labels)
+            else:
+                element = spec.field_selectors[name].select_one(soup)
+                if element is not None and element.text.strip():
+                    details[name] = element.text.strip()
+    return {name: details.get(name) for name in DETAIL_FIELDS}
+
+
+def is_detail_page(spec, html_source):
+    """True if a response is a rendered product page (not an error page or a bot wall)."""
+    return has_class(html_source, spec.ready_class) or LD_JSON_PATTERN.search(html_source) is not None
+
+
+class DetailStore:
+    """Details and HTTP validators of each product page from earlier runs (SQLite, WAL).
+
+    The pages of ``site`` are loaded into memory up front, so the fetch
+    threads never touch the database; ``save`` writes a page's worth of
+    entries in one transaction.
+    """
+
+    def __init__(self, path, site):
+        self.site = site
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS details (
+                url TEXT PRIMARY KEY,
+                site TEXT NOT NULL,
+                sku TEXT,
+                frame_size TEXT,
+                material TEXT,
+                colors TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS details_site ON details(site);
+        """)
+        self.known = {
+            row[0]: DetailEntry(*row)
+            for row in self.db.execute(
+                "SELECT url, sku, frame_size, material, colors, etag, last_modified, checked_at "
+                "FROM details WHERE site = ?", (site,)
+            )
+        }
+
+    def get(self, url):
+        return self.known.get(url)
+
+    def conditional_headers(self, url):
+        """``If-None-Match``/``If-Modified-Since`` headers for a conditional request, if validators are known."""
+        entry = self.known.get(url)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def save(self, entries):
+        entries = list(entries)
+        if not entries:
+            return
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO details (url, site, sku, frame_size, material, colors, etag, last_modified, "
+                "checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(entry.url, self.site, *entry[1:]) for entry in entries],
+            )
+        self.known.update((entry.url, entry) for entry in entries)
+
+    def close(self):
+        self.db.close()
+
+
+class DetailFetcher:
+    """Fetches product pages with at most ``concurrency`` requests in flight and extracts their details.
+
+    Each URL is submitted on its own and picked up by the next free thread,
+    so one slow page holds up nothing but itself; a URL submitted again
+    while its fetch is pending (a product listed on several pages) shares
+    that fetch. Fetches are only held until their page is merged; by then
+    the store has the details, so memory does not grow with the catalog.
+    Details checked less than ``max_age`` seconds ago are reused without
+    a request, older ones are revalidated (a 304 keeps them). A page that still fails after
+    ``retries`` goes to ``browser`` (a CrawlScheduler for product pages)
+    when given; failing that, the product keeps its stored details, if any.
+    ``controller`` paces the HTTP requests like the listing fetcher's.
+    """
+
+    def __init__(self, spec, store, concurrency=8, max_age=7 * 86400, retries=2, backoff=2.0, controller=None,
+                 browser=None, backend="html.parser"):
+        self.spec = spec
+        self.store = store
+        self.max_age = max_age
+        self.retries = retries
+        self.backoff = backoff
+        self.browser = browser
+        self.backend = backend
+        self.http = HttpFetcher(
+            concurrency=concurrency, controller=controller, is_complete=lambda html: is_detail_page(spec, html),
+            conditional=store.conditional_headers,
+        )
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='detail')
+        self.futures = {}
+        self.counts = Counter()
+
+    def submit(self, url):
+        """Schedules ``url``; returns a future of ``(outcome, DetailEntry or None)``."""
+        future = self.futures.get(url)
+        if future is None:
+            future = self.futures[url] = self.executor.submit(self._fetch, url)
+        return future
+
+    def _entry(self, url, html_source, validators=None):
+        with crawl_metrics.stage('detail_extract'):
+            details = extract_details(self.spec, html_source, self.backend)
+        validators = validators or {}
+        return DetailEntry(url, **details, etag=validators.get('etag'), last_modified=validators.get('last_modified'),
+                           checked_at=time.time())
+
+    def _fetch(self, url):
+        known = self.store.get(url)
+        if known is not None and self.max_age and time.time() - known.checked_at < self.max_age:
+            return 'reused', known
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            result = self.http.fetch(url)
+            if result.status == 304 and known is not None:
+                return 'not_modified', known._replace(checked_at=time.time())
+            if result.html is not None and result.status == 200 and is_detail_page(self.spec, result.html):
+                return 'fetched', self._entry(url, result.html, result.validators)
+            if result.status in (404, 410):
+                # The product is gone; retrying will not bring it back
+                print(f"Product page {url} answered {result.status}.")
+                return 'failed', known
+
+        if self.browser is not None:
+            for _, html_source in self.browser.crawl([url]):
+                if html_source and is_detail_page(self.spec, html_source):
+                    return 'fetched', self._entry(url, html_source)
+        print(f"Could not load product page {url}; keeping its stored details." if known else
+              f"Could not load product page {url}.")
+        return 'failed', known
+
+    def merge(self, records, futures):
+        """Waits for the details of ``records`` and returns the records with them merged in.
+
+        The page's freshly fetched or revalidated entries are saved in one batch.
+        """
+        merged, checked = [], []
+        for record, future in zip(records, futures):
+            outcome, entry = future.result() if future is not None else ('no_link', None)
+            if future is not None and self.futures.get(record.url) is future:
+                del self.futures[record.url]
+            self.counts[outcome] += 1
+            if outcome in ('fetched', 'not_modified') and entry is not self.store.get(entry.url):
+                checked.append(entry)
+            if entry is not None:
+                record = dataclasses.replace(record, **{name: getattr(entry, name) for name in DETAIL_FIELDS})
+            merged.append(record)
+        with crawl_metrics.stage('detail_store'):
+            self.store.save(checked)
+        return merged
+
+    def report(self, crawl_id):
+        counts = self.counts
+        print(f"Crawl {crawl_id}: product details {counts['fetched']} fetched, {counts['not_modified']} unchanged (304), "
+              f"{counts['reused']} reused without a request, {counts['failed']} failed, "
+              f"{counts['no_link']} product(s) without a link.")
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.http.close()
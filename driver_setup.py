@@ -0,0 +1,237 @@
+"""Chrome startup helpers: a cached chromedriver path and a reusable browser daemon.
+
+``ChromeDriverManager().install()`` checks (and may download) a driver on
+every run. The path it resolves is cached in ``DRIVER_CACHE_FILENAME`` and
+reused while the binary still exists and the entry is younger than
+``max_age``; if Chrome was upgraded and the cached driver no longer starts
+a session, it is resolved again once. ``CHROMEDRIVER_PATH`` pins a driver
+and skips the manager entirely.
+
+For short scheduled crawls a long-lived headless Chrome can be started once::
+
+    python driver_setup.py --serve --port 9222
+
+and the scrapers attached to it with ``--attach 127.0.0.1:9222``.
+
+Load profiles trim what the browser fetches: ``lean`` (the default) uses
+the ``eager`` page load strategy and blocks images, media, fonts and common
+analytics/ad domains through the DevTools protocol; ``full`` loads pages
+the way a normal browser would.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from selenium import webdriver
+from selenium.common.exceptions import SessionNotCreatedException
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+import crawl_metrics
+from fetch_backends import USER_AGENT
+
+DRIVER_CACHE_FILENAME = './.webdriver/chromedriver.json'
+DRIVER_CACHE_MAX_AGE = 7 * 86400
+LOAD_PROFILES = ('lean', 'full')
+# Nothing the extractors read lives in these; patterns use Network.setBlockedURLs wildcards
+BLOCKED_RESOURCE_PATTERNS = (
+    '*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.avif*', '*.svg*', '*.ico*',
+    '*.mp4*', '*.webm*', '*.m3u8*', '*.mp3*',
+    '*.woff*', '*.ttf*', '*.otf*', '*.eot*',
+)
+BLOCKED_DOMAINS = (
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'googleadservices.com', 'facebook.net', 'connect.facebook.com', 'hotjar.com', 'criteo.com',
+    'criteo.net', 'bat.bing.com', 'analytics.tiktok.com', 'ct.pinterest.com', 'quantserve.com',
+    'scorecardresearch.com', 'adsrvr.org', 'taboola.com', 'outbrain.com', 'newrelic.com', 'nr-data.net',
+)
+CHROME_BINARIES = ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome')
+
+
+def cached_driver_path(cache_filename=DRIVER_CACHE_FILENAME, max_age=DRIVER_CACHE_MAX_AGE):
+    """Returns the cached driver path if it is still usable, else None."""
+    try:
+        with open(cache_filename, 'r') as cache_file:
+            entry = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    path = entry.get('path')
+    if not path or not os.access(path, os.X_OK):
+        return None
+    if max_age is not None and time.time() - entry.get('resolved_at', 0) > max_age:
+        return None
+    return path
+
+
+def save_driver_path(path, cache_filename=DRIVER_CACHE_FILENAME, browser_version=None):
+    """Caches a freshly resolved driver path.
+
+    Each writer gets its own temporary file, so scrapers starting browsers
+    at the same time cannot trip over each other; the cache is only a
+    shortcut, so failing to write it is not an error.
+    """
+    directory = os.path.dirname(cache_filename) or '.'
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix='.chromedriver-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump({'path': path, 'resolved_at': time.time(), 'browser_version': browser_version}, cache_file)
+            os.replace(tmp_filename, cache_filename)
+        except BaseException:
+            os.unlink(tmp_filename)
+            raise
+    except OSError as e:
+        print(f"Could not cache the chromedriver path: {e}")
+
+
+def resolve_driver_path(cache_filename=DRIVER_CACHE_FILENAME, max_age=DRIVER_CACHE_MAX_AGE, refresh=False):
+    """Returns ``(path, from_cache)`` for the chromedriver binary to use."""
+    pinned = os.environ.get('CHROMEDRIVER_PATH')
+    if pinned:
+        return pinned, False
+    if not refresh:
+        path = cached_driver_path(cache_filename, max_age)
+        if path is not None:
+            return path, True
+    with crawl_metrics.stage('driver_resolve'):
+        path = ChromeDriverManager().install()
+    save_driver_path(path, cache_filename)
+    return path, False
+
+
+def start_chrome(options, cache_filename=DRIVER_CACHE_FILENAME, max_age=DRIVER_CACHE_MAX_AGE):
+    """Starts a Chrome session with the cached driver, re-resolving it once if it is stale."""
+    path, from_cache = resolve_driver_path(cache_filename, max_age)
+    try:
+        driver = webdriver.Chrome(service=Service(path), options=options)
+    except SessionNotCreatedException:
+        if not from_cache:
+            raise
+        # Usually a Chrome upgrade the cached driver does not support
+        print("Cached chromedriver could not start a session, resolving it again...")
+        path, from_cache = resolve_driver_path(cache_filename, max_age, refresh=True)
+        driver = webdriver.Chrome(service=Service(path), options=options)
+    # Only a fresh resolve restarts the cache's clock; a start from the cache leaves it to expire
+    if not from_cache and not os.environ.get('CHROMEDRIVER_PATH'):
+        save_driver_path(path, cache_filename, driver.capabilities.get('browserVersion'))
+    return driver
+
+
+def attach_to(options, debugger_address):
+    """Points the options at an already running Chrome instead of launching one.
+
+    Launch arguments such as ``user-agent=`` do not reach that browser; see
+    ``override_user_agent``.
+    """
+    options.add_experimental_option('debuggerAddress', debugger_address)
+    return options
+
+
+def override_user_agent(driver, user_agent=USER_AGENT):
+    """Sets the User-Agent of a running session over the DevTools protocol (for an attached browser)."""
+    driver.execute_cdp_cmd('Network.setUserAgentOverride', {'userAgent': user_agent})
+
+
+def apply_load_profile(options, profile='lean'):
+    """Sets the launch options of a load profile (call before starting Chrome)."""
+    if profile not in LOAD_PROFILES:
+        raise ValueError(f"Unknown load profile {profile!r}, expected one of {LOAD_PROFILES}")
+    if profile == 'lean':
+        options.page_load_strategy = 'eager'
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_argument('--mute-audio')
+        options.add_argument('--autoplay-policy=user-gesture-required')
+    return options
+
+
+def block_resources(driver, profile='lean', blocked_domains=BLOCKED_DOMAINS):
+    """Blocks images, media, fonts and third-party trackers for a running session.
+
+    Done over the DevTools protocol so it also applies to a browser the
+    driver attached to, where launch options have no effect.
+    """
+    if profile != 'lean':
+        return
+    patterns = list(BLOCKED_RESOURCE_PATTERNS) + [f"*{domain}*" for domain in blocked_domains]
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+
+
+class tile_count_settled:
+    """Expected condition: the number of product tiles stopped changing for ``settle`` seconds.
+
+    Returns the tile count once settled. With ``container`` the page must
+    show that element first, so an empty listing settles at zero instead of
+    a page that simply has not rendered yet.
+    """
+
+    def __init__(self, tile_locator, container_locator=None, settle=0.75):
+        self.tile_locator = tile_locator
+        self.container_locator = container_locator
+        self.settle = settle
+        self.count = None
+        self.since = None
+
+    def __call__(self, driver):
+        if self.container_locator is not None and not driver.find_elements(*self.container_locator):
+            return False
+        count = len(driver.find_elements(*self.tile_locator))
+        now = time.monotonic()
+        if count != self.count:
+            self.count, self.since = count, now
+            return False
+        if now - self.since < self.settle:
+            return False
+        # WebDriverWait treats 0 as "not yet"
+        return count or True
+
+
+def find_chrome():
+    for name in CHROME_BINARIES:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def launch_browser(port=9222, user_data_dir='./.webdriver/profile', binary=None, extra_args=(), user_agent=USER_AGENT):
+    """Starts a headless Chrome with remote debugging on ``port`` and returns its process.
+
+    ``user_agent`` replaces headless Chrome's own, which names it "HeadlessChrome".
+    """
+    binary = binary or find_chrome()
+    if binary is None:
+        raise FileNotFoundError("No Chrome/Chromium binary found; pass --binary")
+    os.makedirs(user_data_dir, exist_ok=True)
+    return subprocess.Popen([
+        binary, '--headless=new', '--disable-gpu', f'--remote-debugging-port={port}',
+        f'--user-data-dir={os.path.abspath(user_data_dir)}', '--no-first-run', '--no-default-browser-check',
+        f'--user-agent={user_agent}', *extra_args,
+    ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resolve the chromedriver or run a long-lived headless Chrome")
+    parser.add_argument('--serve', action='store_true', help="Start a headless Chrome for the scrapers to --attach to")
+    parser.add_argument('--port', type=int, default=9222)
+    parser.add_argument('--binary', help="Chrome/Chromium executable (default: first one on PATH)")
+    parser.add_argument('--user-data-dir', default='./.webdriver/profile')
+    parser.add_argument('--refresh', action='store_true', help="Resolve the chromedriver again and update the cache")
+    args = parser.parse_args()
+
+    if args.serve:
+        process = launch_browser(args.port, args.user_data_dir, args.binary)
+        print(f"Headless Chrome listening on 127.0.0.1:{args.port} (pid {process.pid}). Ctrl+C to stop.")
+        try:
+            process.wait()
+        except KeyboardInterrupt:
+            process.terminate()
+            process.wait()
+    else:
+        path, from_cache = resolve_driver_path(refresh=args.refresh)
+        print(f"chromedriver: {path}{' (cached)' if from_cache else ''}")
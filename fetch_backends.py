@@ -0,0 +1,284 @@
+import asyncio
+import copy
+import re
+import threading
+import time
+from collections import namedtuple
+from contextlib import nullcontext
+
+import httpx
+
+import crawl_metrics
+from rate_control import HostBlocked, classify_exception, classify_response, looks_blocked, retry_after_seconds
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.6778.265 Safari/537.36"
+
+FETCH_MODES = ('selenium', 'http', 'auto')
+
+# One fetched page; ``backend`` is 'http' or 'selenium', ``html`` is None if the fetch failed (and
+# empty for a 304). ``validators`` holds the response's ETag and Last-Modified, when sent.
+FetchResult = namedtuple('FetchResult', ['url', 'html', 'status', 'backend', 'validators'], defaults=(None,))
+
+
+def has_class(html_source, class_name):
+    """Cheap check for an element carrying ``class_name`` without parsing the page."""
+    pattern = rf'class=["\'][^"\']*(?<![\w-]){re.escape(class_name)}(?![\w-])'
+    return re.search(pattern, html_source) is not None
+
+
+class HttpFetcher:
+    """Plain HTTP client with connection pooling and keep-alive.
+
+    gzip/deflate responses are always decoded; brotli is negotiated when the
+    ``brotli`` package is installed. Batches run concurrently on an asyncio
+    event loop in a background thread, started with the first batch and
+    kept, with its client and that client's connections, until ``close``.
+    ``headers`` are sent with every request, and
+    ``conditional(url)`` may add per-request validator headers
+    (``If-None-Match``/``If-Modified-Since``).
+    """
+
+    def __init__(self, concurrency=8, timeout=15.0, controller=None, is_complete=None, headers=None, conditional=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.conditional = conditional
+        self.controller = controller
+        self.is_complete = is_complete
+        self.client = httpx.Client(**self._client_options())
+        self.loop = None
+        self.loop_thread = None
+        self.async_client = None
+        self.loop_lock = threading.Lock()
+
+    def _client_options(self):
+        return {
+            'headers': {'User-Agent': USER_AGENT, **self.headers},
+            'limits': httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            'timeout': self.timeout,
+            'follow_redirects': True,
+        }
+
+    @staticmethod
+    def _result(url, response=None, error=None):
+        if error is not None:
+            print(f"HTTP error fetching {url}: {error}")
+            crawl_metrics.error(type(error).__name__, url, str(error))
+            return FetchResult(url, None, None, 'http')
+        if response.status_code >= 400:
+            crawl_metrics.error(f"http_{response.status_code}", url)
+        validators = {
+            'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+        }
+        return FetchResult(url, response.text, response.status_code, 'http', validators)
+
+    def _request_headers(self, url, headers=None):
+        if self.conditional is None:
+            return headers
+        return {**(headers or {}), **self.conditional(url)}
+
+    def _slot(self, url):
+        return self.controller.slot(url) if self.controller is not None else nullcontext()
+
+    def _aslot(self, url):
+        return self.controller.aslot(url) if self.controller is not None else nullcontext()
+
+    def _record(self, url, started, response=None, error=None):
+        """Reports the outcome of a request to the rate controller."""
+        if self.controller is None:
+            return
+        latency = time.monotonic() - started
+        if error is not None:
+            self.controller.record(url, classify_exception(error), latency)
+        else:
+            self.controller.record(
+                url, classify_response(response.status_code, response.text, self.is_complete), latency,
+                retry_after=retry_after_seconds(response.headers.get('Retry-After')),
+            )
+
+    def fetch(self, url, headers=None):
+        """Fetches one URL, with ``headers`` added to the request."""
+        try:
+            with self._slot(url):
+                started = time.monotonic()
+                try:
+                    with crawl_metrics.stage('http_get'):
+                        response = self.client.get(url, headers=self._request_headers(url, headers))
+                except httpx.HTTPError as e:
+                    self._record(url, started, error=e)
+                    return self._result(url, error=e)
+                self._record(url, started, response)
+        except HostBlocked as e:
+            return self._result(url, error=e)
+        return self._result(url, response)
+
+    async def _fetch_async(self, client, semaphore, url, headers=None):
+        async with semaphore:
+            try:
+                async with self._aslot(url):
+                    started = time.monotonic()
+                    try:
+                        with crawl_metrics.stage('http_get'):
+                            response = await client.get(url, headers=self._request_headers(url, headers))
+                    except httpx.HTTPError as e:
+                        self._record(url, started, error=e)
+                        return self._result(url, error=e)
+                    self._record(url, started, response)
+            except HostBlocked as e:
+                return self._result(url, error=e)
+        return self._result(url, response)
+
+    async def _fetch_batch(self, urls, headers=None):
+        if self.async_client is None:
+            self.async_client = httpx.AsyncClient(**self._client_options())
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._fetch_async(self.async_client, semaphore, url, headers) for url in urls))
+
+    def _event_loop(self):
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.loop_thread = threading.Thread(target=self.loop.run_forever, name='http-loop', daemon=True)
+                self.loop_thread.start()
+        return self.loop
+
+    def fetch_many(self, urls, headers=None):
+        """Fetches the URLs concurrently (``headers`` added to each request); returns the results in input order."""
+        return asyncio.run_coroutine_threadsafe(self._fetch_batch(list(urls), headers), self._event_loop()).result()
+
+    def close(self):
+        self.client.close()
+        with self.loop_lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        if self.async_client is not None:
+            asyncio.run_coroutine_threadsafe(self.async_client.aclose(), loop).result()
+            self.async_client = None
+        loop.call_soon_threadsafe(loop.stop)
+        self.loop_thread.join()
+        loop.close()
+
+
+class PageFetcher:
+    """Fetches listing pages with the selected backend.
+
+    In ``auto`` mode a page is fetched over HTTP first and only re-fetched
+    through Selenium (via the crawl scheduler) when the response is not a
+    200 or lacks the product containers checked by ``is_complete``. When a
+    snapshot ``cache`` is given every successfully fetched page is stored in
+    it under ``crawl_id``.
+
+    Pages that fail (no body, HTTP 403, 429 or 5xx, or a bot wall) are
+    retried up to ``retries`` times with exponential backoff starting at
+    ``backoff`` seconds. An optional rate ``controller`` paces the HTTP
+    requests per host (the scheduler paces the browser ones).
+    ``fragment_headers`` are added to the HTTP requests for the URLs passed
+    as ``fragments`` (next pages of a load-more chain, which the server
+    then answers with just the new tiles). With ``conditional`` HTTP
+    requests carry the validators it returns for the URL, and a 304 counts
+    as a usable page.
+    """
+
+    def __init__(self, mode, scheduler, is_complete, http_concurrency=8, batch_size=20, cache=None, crawl_id=None,
+                 retries=3, backoff=2.0, controller=None, fragment_headers=None, conditional=None):
+        if mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode {mode!r}, expected one of {FETCH_MODES}")
+        self.mode = mode
+        self.scheduler = scheduler
+        self.is_complete = is_complete
+        self.batch_size = batch_size
+        self.cache = cache
+        self.crawl_id = crawl_id
+        self.retries = retries
+        self.backoff = backoff
+        self.fragment_headers = fragment_headers
+        self.http = (
+            HttpFetcher(
+                concurrency=http_concurrency, controller=controller, is_complete=is_complete, conditional=conditional,
+            )
+            if mode != 'selenium' else None
+        )
+
+    def _usable(self, result):
+        if result.status == 304:
+            return True
+        return result.html is not None and result.status == 200 and self.is_complete(result.html)
+
+    def _fetch_selenium(self, urls):
+        return [FetchResult(url, html, None, 'selenium') for url, html in self.scheduler.crawl(urls)]
+
+    def _fetch_http(self, urls, fragments=()):
+        results = {}
+        fragment_urls = [url for url in urls if url in fragments] if self.fragment_headers else []
+        pages = [url for url in urls if url not in fragment_urls]
+        for group, headers in ((pages, None), (fragment_urls, self.fragment_headers)):
+            if group:
+                if len(group) > 1:
+                    results.update((result.url, result) for result in self.http.fetch_many(group, headers))
+                else:
+                    results[group[0]] = self.http.fetch(group[0], headers)
+        return [results[url] for url in urls]
+
+    def _fetch_batch(self, urls, fragments=()):
+        if self.mode == 'selenium':
+            return self._fetch_selenium(urls)
+
+        results = self._fetch_http(urls, fragments)
+        if self.mode == 'http':
+            return results
+
+        fallback_urls = [result.url for result in results if not self._usable(result)]
+        if fallback_urls:
+            print(f"Falling back to Selenium for {len(fallback_urls)} of {len(urls)} pages")
+            fallback = {result.url: result for result in self._fetch_selenium(fallback_urls)}
+            results = [fallback.get(result.url, result) for result in results]
+        return results
+
+    def failed(self, result):
+        """True if the page could not be fetched, the server refused it (403/429/5xx) or it is a bot wall."""
+        if result.html is None or result.status in (403, 429) or (result.status or 0) >= 500:
+            return True
+        return not self.is_complete(result.html) and looks_blocked(result.html)
+
+    def _fetch_with_retries(self, urls, fragments=()):
+        results = dict((result.url, result) for result in self._fetch_batch(urls, fragments))
+        for attempt in range(1, self.retries + 1):
+            failed_urls = [url for url in urls if self.failed(results[url])]
+            if not failed_urls:
+                break
+            delay = self.backoff * 2 ** (attempt - 1)
+            print(f"Retrying {len(failed_urls)} page(s) in {delay:.0f}s (attempt {attempt}/{self.retries})")
+            time.sleep(delay)
+            results.update((result.url, result) for result in self._fetch_batch(failed_urls, fragments))
+        return [results[url] for url in urls]
+
+    def _store(self, results):
+        if self.cache is not None:
+            for result in results:
+                if not self.failed(result) and result.status != 304:
+                    self.cache.put(result.url, result.html, self.crawl_id, status=result.status, backend=result.backend)
+        return results
+
+    def fetch(self, url, fragment=False):
+        """Fetches a single page (as a load-more fragment with ``fragment``)."""
+        return self._store(self._fetch_with_retries([url], {url} if fragment else ()))[0]
+
+    def fetch_many(self, urls, fragments=()):
+        """Yields results in input order, fetching ``batch_size`` pages at a time.
+
+        URLs in ``fragments`` are requested with the fragment headers.
+        """
+        urls = list(urls)
+        for start in range(0, len(urls), self.batch_size):
+            yield from self._store(self._fetch_with_retries(urls[start:start + self.batch_size], fragments))
+
+    def uncached(self):
+        """This fetcher without the snapshot cache, sharing its clients (close the original, not this)."""
+        fetcher = copy.copy(self)
+        fetcher.cache = None
+        return fetcher
+
+    def close(self):
+        if self.http is not None:
+            self.http.close()
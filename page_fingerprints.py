@@ -0,0 +1,164 @@
+"""Change fingerprints of listing pages, kept between runs.
+
+A page's fingerprint hashes the text of its product tiles (markup,
+scripts and whitespace are normalized away, so lazy-loaded images or
+shuffled attributes do not count as changes) together with its link to
+the next page and the highest page number it links to. When a page comes
+back with the fingerprint of the previous run, or the server answers a
+conditional request with 304 Not Modified, its extraction can be skipped:
+its products, next page and page count are what was recorded last time,
+and its rows are carried over from the previous output.
+"""
+import hashlib
+import html
+import json
+import re
+import sqlite3
+import time
+from collections import namedtuple
+
+# What is known about one listing page; ``unchanged`` is set when a fetch matched the previous run
+PageFingerprint = namedtuple(
+    'PageFingerprint',
+    ['url', 'fingerprint', 'etag', 'last_modified', 'next_url', 'page_count', 'high_water', 'identities', 'unchanged'],
+    defaults=(None, None, None, 1, 0, (), False),
+)
+
+NOISE_PATTERN = re.compile(r'<script\b.*?</script>|<style\b.*?</style>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r'<[^>]*>')
+SPACE_PATTERN = re.compile(r'\s+')
+
+
+def _tile_end(tile_tag, source, start):
+    """End offset of the element whose start tag is at ``start`` (the end of ``source`` if it never closes)."""
+    depth = 0
+    for match in re.finditer(rf'<(/?){tile_tag}\b[^>]*>', source[start:]):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return start + match.end()
+    return len(source)
+
+
+def page_fingerprint(adapter, tiles_source, html_source):
+    """Hashes the product tiles in ``tiles_source`` plus the pagination of ``html_source``; None without tiles.
+
+    ``tiles_source`` is the page, or the part of it after a load-more
+    high-water mark, so a re-rendered cumulative page and the fragment
+    with the same new tiles get the same fingerprint.
+    """
+    tiles = list(adapter.tile_pattern.finditer(tiles_source))
+    if not tiles:
+        return None
+    tile_tag = adapter.container_selector.steps[-1][0] or r'[a-zA-Z][\w-]*'
+    region = tiles_source[tiles[0].start():_tile_end(tile_tag, tiles_source, tiles[-1].start())]
+    text = SPACE_PATTERN.sub(' ', html.unescape(TAG_PATTERN.sub(' ', NOISE_PATTERN.sub(' ', region)))).strip()
+
+    next_tag = ''
+    match = adapter.next_pattern.search(html_source)
+    if match is not None:
+        next_tag = html_source[match.start():html_source.find('>', match.end()) + 1]
+    last_page = ''
+    param = adapter.pagination.page_param
+    if param is not None:
+        last_page = str(max((int(n) for n in re.findall(rf'[?&](?:amp;)?{re.escape(param)}=(\d+)', html_source)), default=1))
+
+    payload = '\x1f'.join((text, next_tag, last_page))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class FingerprintStore:
+    """Fingerprints, HTTP validators and products of each listing page from earlier runs (SQLite, WAL).
+
+    The pages of ``site`` are loaded into memory up front, so lookups from
+    fetch threads never touch the database; only ``record`` writes.
+    ``key`` maps a product to its identity, which is stored per page so the
+    products of a skipped page can still be accounted for. With
+    ``skip_unchanged`` off, fingerprints are still recorded (for
+    ``--sample``) but the crawl parses every page and sends no conditional
+    requests.
+    """
+
+    def __init__(self, path, site, key, skip_unchanged=True):
+        self.site = site
+        self.key = key
+        self.skip_unchanged = skip_unchanged
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                site TEXT NOT NULL,
+                fingerprint TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                next_url TEXT,
+                page_count INTEGER NOT NULL DEFAULT 1,
+                high_water INTEGER NOT NULL DEFAULT 0,
+                identities TEXT NOT NULL DEFAULT '[]',
+                crawl_id TEXT NOT NULL,
+                checked_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pages_site ON pages(site);
+        """)
+        self.known = {}
+        for row in self.db.execute(
+            "SELECT url, fingerprint, etag, last_modified, next_url, page_count, high_water, identities "
+            "FROM pages WHERE site = ?", (site,)
+        ):
+            self.known[row[0]] = PageFingerprint(*row[:7], tuple(json.loads(row[7])))
+        self.skipped = 0
+
+    def urls(self):
+        """URLs of every page of the site seen in an earlier run."""
+        return list(self.known)
+
+    def high_water(self, url):
+        entry = self.known.get(url)
+        return entry.high_water if entry is not None else 0
+
+    def conditional_headers(self, url):
+        """``If-None-Match``/``If-Modified-Since`` headers for a conditional request, if validators are known."""
+        entry = self.known.get(url)
+        headers = {}
+        if entry is not None and self.skip_unchanged:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def check(self, url, fingerprint, status=None, validators=None, high_water=0):
+        """Returns this fetch's PageFingerprint; ``unchanged`` carries over what the previous run recorded."""
+        validators = validators or {}
+        previous = self.known.get(url)
+        current = PageFingerprint(
+            url, fingerprint, validators.get('etag'), validators.get('last_modified'), high_water=high_water
+        )
+        if previous is None:
+            return current
+        if status != 304 and (fingerprint is None or fingerprint != previous.fingerprint):
+            return current
+        return previous._replace(
+            etag=current.etag or previous.etag, last_modified=current.last_modified or previous.last_modified,
+            high_water=high_water, unchanged=True,
+        )
+
+    def record(self, entry, crawl_id):
+        """Saves what a crawl learned about a page (skipped as unchanged or extracted)."""
+        if entry.unchanged:
+            self.skipped += 1
+        self.known[entry.url] = entry._replace(unchanged=False)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO pages (url, site, fingerprint, etag, last_modified, next_url, page_count, "
+                "high_water, identities, crawl_id, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.url, self.site, entry.fingerprint, entry.etag, entry.last_modified, entry.next_url,
+                 entry.page_count, entry.high_water, json.dumps(list(entry.identities)), crawl_id, time.time()),
+            )
+
+    def report(self, crawl_id):
+        if self.skipped:
+            print(f"Crawl {crawl_id}: {self.skipped} unchanged page(s) skipped; their rows were carried over.")
+
+    def close(self):
+        self.db.close()
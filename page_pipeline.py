@@ -0,0 +1,186 @@
+import re
+from collections import namedtuple
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+import crawl_metrics
+
+# Products extracted from one listing page plus the URL of the next page (or None)
+PageResult = namedtuple('PageResult', ['products', 'next_url'])
+
+BS4_BACKENDS = ('html.parser', 'lxml', 'html5lib')
+PARSER_BACKENDS = BS4_BACKENDS + ('selectolax',)
+
+
+def class_strainer(*class_names):
+    """Returns a SoupStrainer that only builds subtrees of tags carrying one of the classes.
+
+    The match is done on the raw ``class`` attribute so multi-class tags such as
+    ``<div class="prod-holder col-6">`` are kept.
+    """
+    wanted = set(class_names)
+
+    def has_wanted_class(value):
+        if not value:
+            return False
+        classes = value.split() if isinstance(value, str) else value
+        return not wanted.isdisjoint(classes)
+
+    return SoupStrainer(class_=has_wanted_class)
+
+
+def parse_html(html_source, backend='html.parser', parse_only=None):
+    """Parses an HTML page once with the chosen backend.
+
+    ``parse_only`` is a SoupStrainer for partial parsing. It is ignored by the
+    html5lib and selectolax backends, which always build the full tree.
+    """
+    if backend == 'selectolax':
+        return SelectolaxNode.parse(html_source)
+    if backend not in BS4_BACKENDS:
+        raise ValueError(f"Unknown parser backend {backend!r}, expected one of {PARSER_BACKENDS}")
+    if backend == 'html5lib':
+        parse_only = None
+    return BeautifulSoup(html_source, backend, parse_only=parse_only)
+
+
+def process_page(html_source, extract, find_next, backend='html.parser', parse_only=None):
+    """Parses a page once and runs both the product extractor and the pagination lookup on it."""
+    with crawl_metrics.stage('parse'):
+        soup = parse_html(html_source, backend=backend, parse_only=parse_only)
+    with crawl_metrics.stage('extract'):
+        return PageResult(extract(soup), find_next(soup))
+
+
+class Selector:
+    """A descendant selector compiled once and matched directly against parsed tags.
+
+    Understands the subset of CSS the site specs use: whitespace-separated
+    ``tag.class[attr]`` compounds. BeautifulSoup tags are matched in Python
+    without going through ``find``; selectolax nodes get the CSS as is.
+    """
+
+    __slots__ = ('css', 'steps')
+
+    STEP_PATTERN = re.compile(r'(?P<tag>[\w-]+|\*)?(?P<classes>(?:\.[\w-]+)*)(?P<attrs>(?:\[[\w-]+\])*)')
+
+    def __init__(self, css):
+        self.css = css
+        self.steps = tuple(self._compile(part) for part in css.split())
+        if not self.steps:
+            raise ValueError("Empty selector")
+
+    @classmethod
+    def _compile(cls, part):
+        match = cls.STEP_PATTERN.fullmatch(part)
+        if match is None:
+            raise ValueError(f"Unsupported selector step {part!r}")
+        tag = match.group('tag')
+        return (
+            None if tag in (None, '*') else tag,
+            frozenset(re.findall(r'\.([\w-]+)', match.group('classes'))),
+            tuple(re.findall(r'\[([\w-]+)\]', match.group('attrs'))),
+        )
+
+    def __repr__(self):
+        return f"Selector({self.css!r})"
+
+    @property
+    def tag(self):
+        """Tag name of the element the selector picks (None for any)."""
+        return self.steps[-1][0]
+
+    @property
+    def outer_classes(self):
+        """Classes of the outermost step, which a partial parse has to keep."""
+        return self.steps[0][1]
+
+    @staticmethod
+    def _step_matches(step, tag):
+        name, classes, attrs = step
+        if name is not None and tag.name != name:
+            return False
+        if classes:
+            value = tag.get('class') or ()
+            if isinstance(value, str):
+                value = value.split()
+            if not classes.issubset(value):
+                return False
+        return all(tag.has_attr(attr) for attr in attrs)
+
+    def matches(self, tag, root=None):
+        """True if ``tag`` matches, with every ancestor step found below ``root``."""
+        if not self._step_matches(self.steps[-1], tag):
+            return False
+        ancestor = tag.parent
+        for step in reversed(self.steps[:-1]):
+            while ancestor is not None and ancestor is not root and not self._step_matches(step, ancestor):
+                ancestor = ancestor.parent
+            if ancestor is None or ancestor is root:
+                return False
+            ancestor = ancestor.parent
+        return True
+
+    def select(self, root):
+        """Every matching element below ``root``, in document order."""
+        if isinstance(root, SelectolaxNode):
+            return [SelectolaxNode(node) for node in root.node.css(self.css)]
+        return [tag for tag in root.descendants if isinstance(tag, Tag) and self.matches(tag, root)]
+
+    def select_one(self, root):
+        """The first matching element below ``root``, or None."""
+        if isinstance(root, SelectolaxNode):
+            node = root.node.css_first(self.css)
+            return SelectolaxNode(node) if node is not None else None
+        for tag in root.descendants:
+            if isinstance(tag, Tag) and self.matches(tag, root):
+                return tag
+        return None
+
+
+class SelectolaxNode:
+    """Minimal BeautifulSoup-like wrapper over a selectolax node.
+
+    Only covers what the extractors use: ``find``, ``find_all``, ``text``,
+    ``attrs`` and item access.
+    """
+
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        self.node = node
+
+    @classmethod
+    def parse(cls, html_source):
+        try:
+            from selectolax.lexbor import LexborHTMLParser
+        except ImportError as e:
+            raise ImportError("The 'selectolax' parser backend requires the selectolax package") from e
+        return cls(LexborHTMLParser(html_source).root)
+
+    @staticmethod
+    def _selector(name, class_=None, attrs=None):
+        selector = name or '*'
+        if class_:
+            selector += ''.join(f".{c}" for c in class_.split())
+        for attr, value in (attrs or {}).items():
+            selector += f"[{attr}]" if value is True else f'[{attr}="{value}"]'
+        return selector
+
+    def find_all(self, name=None, class_=None, attrs=None):
+        return [SelectolaxNode(n) for n in self.node.css(self._selector(name, class_, attrs))]
+
+    def find(self, name=None, class_=None, attrs=None):
+        node = self.node.css_first(self._selector(name, class_, attrs))
+        return SelectolaxNode(node) if node is not None else None
+
+    @property
+    def text(self):
+        return self.node.text()
+
+    @property
+    def attrs(self):
+        return dict(self.node.attributes)
+
+    def __getitem__(self, key):
+        return self.node.attributes[key]
@@ -0,0 +1,102 @@
+"""Extraction in worker processes, overlapped with fetching.
+
+``html.parser`` is pure Python, so with several browsers feeding pages a
+single process spends its time parsing while the browsers wait. A ParsePool
+moves parsing and extraction into a ProcessPoolExecutor: fetch results come
+in through a bounded queue (see ``pipeline.buffered``), at most
+``max_in_flight`` pages are being parsed at once, and the parsed pages are
+handed back in fetch order to the single writer stage. When the writer
+falls behind, the queue fills and the fetchers wait.
+
+Workers are spawned rather than forked: a fork would copy the parent's
+active CrawlMetrics (its open event log, unflushed buffer and locks held by
+fetch threads) into every worker. Parse timings reach the metrics through
+the parent instead, as the ``parse_worker`` stage.
+"""
+import dataclasses
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import crawl_metrics
+from pipeline import buffered
+from product_record import ProductRecord
+from site_adapters import ADAPTERS
+
+
+# Adapters rebuilt for a non-default base URL, per worker process
+_adapters = {}
+
+
+def worker_adapter(site, base_url):
+    """The site's adapter, pointed at ``base_url`` (adapters hold a strainer closure and do not pickle)."""
+    adapter = ADAPTERS[site]
+    if adapter.base_url == base_url:
+        return adapter
+    key = (site, base_url)
+    if key not in _adapters:
+        _adapters[key] = dataclasses.replace(adapter, base_url=base_url)
+    return _adapters[key]
+
+
+def parse_page(site, base_url, html_source, backend, count_pages, high_water=0):
+    """Worker side: returns ``(rows, next_url, page_count, seconds)`` for one page.
+
+    Records travel back as plain tuples, which pickle smaller than dataclasses.
+    """
+    # Imported here because site_engine itself imports this module
+    import site_engine
+
+    start = time.perf_counter()
+    adapter = worker_adapter(site, base_url)
+    products, next_url = site_engine.process_page(adapter, html_source, backend=backend, high_water=high_water)
+    page_count = site_engine.find_page_count(adapter, html_source) if count_pages and next_url else 1
+    rows = [tuple(getattr(record, name) for name in ProductRecord.__slots__) for record in products]
+    return rows, next_url, page_count, time.perf_counter() - start
+
+
+class ParsePool:
+    """Process pool that parses fetched pages while the fetchers keep going."""
+
+    def __init__(self, workers=None, max_in_flight=None, queue_size=None):
+        workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.max_in_flight = max_in_flight or workers * 2
+        self.queue_size = queue_size or workers * 2
+
+    def imap(self, adapter, results, backend, count_pages, failed, high_water=None):
+        """Yields ``(result, parsed)`` in input order.
+
+        ``parsed`` is ``(products, next_url, page_count)``, or None for
+        results that ``failed`` rejects (those are not sent to a worker).
+        ``high_water`` maps load-more URLs to their high-water marks.
+        """
+        high_water = high_water if high_water is not None else {}
+        window = deque()
+        for result in buffered(results, self.queue_size):
+            if failed(result):
+                window.append((result, None))
+            else:
+                window.append((result, self.executor.submit(
+                    parse_page, adapter.site, adapter.base_url, result.html, backend, count_pages,
+                    high_water.get(result.url, 0),
+                )))
+            # Hand back whatever is finished at the front; block on the oldest page when the window is full
+            while window and (len(window) >= self.max_in_flight or window[0][1] is None or window[0][1].done()):
+                yield self._resolve(window.popleft())
+        while window:
+            yield self._resolve(window.popleft())
+
+    @staticmethod
+    def _resolve(entry):
+        result, future = entry
+        if future is None:
+            return result, None
+        rows, next_url, page_count, seconds = future.result()
+        crawl_metrics.observe('parse_worker', seconds)
+        return result, ([ProductRecord(*row) for row in rows], next_url, page_count)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
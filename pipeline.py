@@ -0,0 +1,211 @@
+import asyncio
+import queue
+import threading
+from collections import deque, namedtuple
+
+import crawl_metrics
+from product_record import ProductRecord, parse_cents
+from sinks import record_hash
+
+# One extracted listing page: its products, the pages it queued next, the
+# pagination cursor it exposed, the fetch backend that served it, when
+# fingerprints are kept, its PageFingerprint (products are left empty for
+# an unchanged page until carry_forward fills them in) and, along a
+# load-more chain, the high-water marks of the pages it queued
+CrawlPage = namedtuple(
+    'CrawlPage', ['url', 'products', 'next_urls', 'cursor', 'backend', 'fingerprint', 'high_water'],
+    defaults=(None, None),
+)
+
+
+def run_pipeline(source, *stages):
+    """Chains generator stages: each stage takes the previous iterator and returns a new one."""
+    for stage in stages:
+        source = stage(source)
+    return source
+
+
+def buffered(source, maxsize=8):
+    """Runs ``source`` in a background thread, handing items over through a bounded queue.
+
+    The producer blocks once ``maxsize`` items are waiting, so it can only
+    run that far ahead of the consumer. Exceptions are re-raised on the
+    consumer side.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in source:
+                if not put((None, item)):
+                    return
+        except BaseException as e:
+            put((e, None))
+        else:
+            put((None, done))
+
+    thread = threading.Thread(target=produce, name='buffered-source', daemon=True)
+    thread.start()
+    try:
+        while True:
+            error, item = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def iter_records(pages):
+    """Flattens pages into individual product records."""
+    for page in pages:
+        yield from page.products
+
+
+def dedup_records(records, key=record_hash):
+    """Drops records whose key was already seen, keeping first-seen order."""
+    seen = set()
+    for record in records:
+        record_key = key(record)
+        if record_key in seen:
+            continue
+        seen.add(record_key)
+        yield record
+
+
+def normalize_prices(records, fields):
+    """Replaces the given price fields of raw dict records with integer cents.
+
+    Records extracted as ProductRecord are already normalized and pass through.
+    """
+    for record in records:
+        if isinstance(record, dict):
+            record = dict(record)
+            for field in fields:
+                if field in record:
+                    record[field] = parse_cents(record[field])
+        yield record
+
+
+def classify_pages(pages, store, crawl_id, delta_only=False):
+    """Classifies each page's products against a DedupStore.
+
+    With ``delta_only`` only new and changed products are passed on.
+    """
+    for page in pages:
+        with crawl_metrics.stage('dedup'):
+            classified = store.classify_page(page.products, crawl_id)
+        if delta_only:
+            page = page._replace(products=[record for status, record in classified if status != 'unchanged'])
+        yield page
+
+
+def enrich_pages(pages, details, lookahead=2):
+    """Merges product page details into each page's products.
+
+    A page's detail fetches are submitted to a DetailFetcher as soon as the
+    page arrives, and the page is passed on once they are all in. Up to
+    ``lookahead`` further pages are taken in meanwhile, so the listing
+    crawl keeps going while the details of earlier pages are fetched, and
+    the backlog of detail fetches stays bounded.
+    """
+    waiting = deque()
+    for page in pages:
+        waiting.append((page, [details.submit(record.url) if record.url else None for record in page.products]))
+        if len(waiting) > lookahead:
+            page, futures = waiting.popleft()
+            yield page._replace(products=details.merge(page.products, futures))
+    while waiting:
+        page, futures = waiting.popleft()
+        yield page._replace(products=details.merge(page.products, futures))
+
+
+def record_prices(pages, history, crawl_id):
+    """Appends the changed prices of each page's products to a PriceHistory."""
+    for page in pages:
+        with crawl_metrics.stage('price_history'):
+            history.record_page(page.products, crawl_id)
+        yield page
+
+
+def write_pages(pages, sink, total_products=0):
+    """Appends each page's products to a StreamingSink and passes the page on."""
+    for page in pages:
+        total_products += len(page.products)
+        with crawl_metrics.stage('save'):
+            new_rows = sink.write_page(page.products)
+        crawl_metrics.page_done(page.url, page.backend, len(page.products))
+        if page.fingerprint is not None and page.fingerprint.unchanged:
+            print(f"Skipped {page.url}: unchanged since the last crawl. Total so far: {total_products}")
+            yield page
+            continue
+        print(f"Extracted {len(page.products)} products ({new_rows} new) from {page.url} via {page.backend}. Total so far: {total_products}")
+        yield page
+
+
+def carry_forward(pages, previous):
+    """Fills in the products of pages skipped as unchanged from the previous output.
+
+    ``previous`` maps a product identity to its row in the last crawl's
+    output; the identities stored with an unchanged page say which of them
+    it listed, so the new output keeps them although the page was not
+    extracted.
+    """
+    for page in pages:
+        entry = page.fingerprint
+        if entry is not None and entry.unchanged and not page.products:
+            page = page._replace(products=[
+                ProductRecord.from_dict(previous[identity]) for identity in entry.identities if identity in previous
+            ])
+        yield page
+
+
+def record_fingerprints(pages, fingerprints, store, crawl_id):
+    """Saves each page's fingerprint once it has been written.
+
+    The products of an unchanged page were not extracted; the DedupStore
+    is told they are still listed, so they are not reported as gone.
+    """
+    for page in pages:
+        entry = page.fingerprint
+        if entry is not None:
+            if entry.unchanged:
+                store.touch(entry.identities, crawl_id)
+            fingerprints.record(entry, crawl_id)
+        yield page
+
+
+def track_state(pages, state, sink):
+    """Records each page in the crawl state once it has been written, for ``--resume``."""
+    for page in pages:
+        if len(page.next_urls) > 1:
+            state.fanned_out = True
+        state.complete(
+            page.url, page.next_urls, sink.offsets(), state.total_products + len(page.products), cursor=page.cursor,
+            high_water=page.high_water,
+        )
+        yield page
+
+
+async def aiter_pages(pages):
+    """Async iterator over a page generator; each step runs in a worker thread."""
+    sentinel = object()
+    while True:
+        page = await asyncio.to_thread(next, pages, sentinel)
+        if page is sentinel:
+            return
+        yield page
@@ -0,0 +1,178 @@
+"""Price history of every product, appended only when a price changes.
+
+    python price_history.py latest --site glasses --brand Ray-Ban
+    python price_history.py history --site framesdirect --brand Oakley --name "OX8046 Airdrop"
+"""
+import argparse
+import sqlite3
+import time
+
+from dedup_store import IDENTITY_FIELDS, identity_key, record_site
+
+PRICE_FIELDS = ('current_price_cents', 'former_price_cents', 'discount_pct')
+
+
+def _field(record, name):
+    return record.get(name) if isinstance(record, dict) else getattr(record, name, None)
+
+
+class PriceHistory:
+    """Time series of product prices in SQLite (WAL), keyed by product identity.
+
+    ``prices`` holds one row per observed change of current price, former
+    price or discount; ``latest`` holds the current row per product so the
+    latest-price query never scans the history. Each page is written in one
+    transaction with batched inserts. A product listed more than once in a
+    crawl (the same frame under two discounts, say) keeps the price it was
+    first seen with, so a repeat does not read as a price change.
+    """
+
+    def __init__(self, path, identity_fields=IDENTITY_FIELDS):
+        self.identity_fields = tuple(identity_fields)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS latest (
+                identity TEXT PRIMARY KEY,
+                site TEXT,
+                brand TEXT,
+                name TEXT,
+                current_price_cents INTEGER,
+                former_price_cents INTEGER,
+                discount_pct REAL,
+                observed_at REAL NOT NULL,
+                crawl_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS latest_site_brand ON latest(site, brand);
+            CREATE TABLE IF NOT EXISTS prices (
+                identity TEXT NOT NULL,
+                observed_at REAL NOT NULL,
+                crawl_id TEXT NOT NULL,
+                current_price_cents INTEGER,
+                former_price_cents INTEGER,
+                discount_pct REAL
+            );
+            CREATE INDEX IF NOT EXISTS prices_identity_time ON prices(identity, observed_at);
+            CREATE INDEX IF NOT EXISTS prices_time ON prices(observed_at);
+        """)
+        self.changes = 0
+        self.crawl_id = None
+        self.seen = set()
+
+    def key(self, record):
+        return identity_key(record, self.identity_fields)
+
+    def record_page(self, records, crawl_id, observed_at=None):
+        """Appends the prices of ``records`` that differ from the latest known ones; returns how many."""
+        observed_at = observed_at or time.time()
+        if crawl_id != self.crawl_id:
+            self.crawl_id, self.seen = crawl_id, set()
+        page = {}
+        for record in records:
+            # A product listed twice keeps its first price, like the sinks do
+            identity = self.key(record)
+            if identity not in self.seen:
+                page.setdefault(identity, record)
+        self.seen.update(page)
+
+        known = {}
+        identities = list(page)
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(identities), 500):
+            chunk = identities[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT identity, crawl_id, {', '.join(PRICE_FIELDS)} FROM latest "
+                f"WHERE identity IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            known.update((row[0], row[1:]) for row in rows)
+
+        changed = []
+        for identity, record in page.items():
+            prices = tuple(_field(record, name) for name in PRICE_FIELDS)
+            latest = known.get(identity)
+            if latest is not None and latest[0] == crawl_id:
+                # Already recorded by this crawl, before a --resume
+                continue
+            if latest is None or latest[1:] != prices:
+                changed.append((identity, record, prices))
+        if not changed:
+            return 0
+
+        with self.db:
+            self.db.executemany(
+                f"INSERT INTO prices (identity, observed_at, crawl_id, {', '.join(PRICE_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                [(identity, observed_at, crawl_id, *prices) for identity, _, prices in changed],
+            )
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO latest (identity, site, brand, name, {', '.join(PRICE_FIELDS)}, observed_at, crawl_id) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (identity, record_site(record), _field(record, 'brand'), _field(record, 'name'), *prices,
+                     observed_at, crawl_id)
+                    for identity, record, prices in changed
+                ],
+            )
+        self.changes += len(changed)
+        return len(changed)
+
+    def latest(self, site=None, brand=None):
+        """Latest known prices as dicts, optionally for one site and brand."""
+        clauses, params = [], []
+        if site is not None:
+            clauses.append("site = ?")
+            params.append(site)
+        if brand is not None:
+            clauses.append("brand = ?")
+            params.append(brand)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        cursor = self.db.execute(
+            f"SELECT site, brand, name, {', '.join(PRICE_FIELDS)}, observed_at, crawl_id FROM latest {where} "
+            f"ORDER BY site, brand, name",
+            params,
+        )
+        return [dict(zip([column[0] for column in cursor.description], row)) for row in cursor]
+
+    def history(self, record=None, identity=None):
+        """Price changes of one product, oldest first. Pass a record (or dict of identity fields) or its identity."""
+        identity = identity or self.key(record)
+        cursor = self.db.execute(
+            f"SELECT observed_at, crawl_id, {', '.join(PRICE_FIELDS)} FROM prices WHERE identity = ? ORDER BY observed_at",
+            (identity,),
+        )
+        return [dict(zip([column[0] for column in cursor.description], row)) for row in cursor]
+
+    def report(self, crawl_id):
+        print(f"Crawl {crawl_id}: {self.changes} price change(s) recorded.")
+
+    def close(self):
+        self.db.close()
+
+
+def _format_cents(cents):
+    return 'N/A' if cents is None else f"${cents / 100:,.2f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the price history store")
+    parser.add_argument('query', choices=('latest', 'history'))
+    parser.add_argument('--db', default='./extracted_data/price_history.sqlite')
+    parser.add_argument('--site')
+    parser.add_argument('--brand')
+    parser.add_argument('--name', help="Product name (history)")
+    args = parser.parse_args()
+
+    history = PriceHistory(args.db)
+    if args.query == 'latest':
+        for row in history.latest(args.site, args.brand):
+            print(f"{row['site']:<14} {row['brand'] or '':<24} {row['name'] or '':<40} "
+                  f"{_format_cents(row['current_price_cents']):>10} {_format_cents(row['former_price_cents']):>10}")
+    else:
+        if not (args.site and args.brand and args.name):
+            parser.error("history needs --site, --brand and --name")
+        for row in history.history({'site': args.site, 'brand': args.brand, 'name': args.name}):
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(row['observed_at']))} {row['crawl_id']:<32} "
+                  f"{_format_cents(row['current_price_cents']):>10} {_format_cents(row['former_price_cents']):>10} "
+                  f"{row['discount_pct'] if row['discount_pct'] is not None else 'N/A'}")
+    history.close()
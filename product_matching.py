@@ -0,0 +1,300 @@
+"""Matches products across vendors and tabulates their current prices side by side.
+
+    python product_matching.py                                  # the two sites' JSON exports
+    python product_matching.py --history ./extracted_data/price_history.sqlite
+    python product_matching.py --left a.json --right b.csv --threshold 0.6
+
+Brands are canonicalized ("Ray-Ban Junior" and "Ray-Ban" are one family)
+and each product is reduced to its model code ("RB5154", split into
+prefix, number and fit suffix) and the trigrams of its descriptive words
+("Clubmaster"). One vendor's products go into an inverted index of those
+keys, blocked by brand, so each product of the other vendor is only
+scored against the few products that share a key with it in the same
+brand, instead of against the whole catalog. Pairs are then assigned
+one-to-one, best score first.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+
+from product_record import ProductRecord
+
+# Words that qualify a brand rather than name it ("Oakley Youth", "Vogue Eyewear")
+BRAND_QUALIFIERS = re.compile(r'\b(?:eyewear|eyeglasses|optical|junior|kids|youth)\b')
+# Canonical brand families for names the vendors spell differently
+BRAND_ALIASES = {
+    'rayban': 'ray ban',
+    'd g': 'dolce gabbana',
+    'ferrari': 'scuderia ferrari',
+    'ck': 'calvin klein',
+}
+# A model code such as "RB5154", "AR 16250" or "MK4098BU": prefix letters, number, fit/variant suffix
+MODEL_CODE = re.compile(r'\b([A-Z]{1,4})[ -]?(\d{3,5})([A-Z]{0,3})\b')
+# Words that describe the listing or the fit rather than the model
+NAME_STOPWORDS = frozenset({
+    'the', 'and', 'with', 'for', 'optics', 'eyeglasses', 'glasses', 'frame', 'frames', 'collection', 'fit',
+    'alternate', 'asian', 'universal', 'low', 'bridge', 'kids', 'youth', 'junior', 'rx',
+})
+
+FIELD_NAMES = {
+    'brand': 'brand', 'name': 'name', 'current price': 'current_price', 'former price': 'former_price',
+    'discount': 'discount', 'discount percentage': 'discount', 'first book status': 'first_badge', 'second book status': 'second_badge',
+}
+
+# One product prepared for matching
+MatchItem = namedtuple('MatchItem', ['site', 'brand', 'name', 'price_cents', 'brand_key', 'code', 'base', 'number', 'grams'])
+
+
+def _ascii(text):
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+
+
+def brand_key(brand):
+    """Canonical brand family used for blocking, e.g. ``"Ray-Ban Junior"`` -> ``"ray ban"``."""
+    text = re.sub(r'[^a-z0-9]+', ' ', _ascii(brand or '').lower())
+    text = ' '.join(BRAND_QUALIFIERS.sub(' ', text).split())
+    return BRAND_ALIASES.get(text, text)
+
+
+def model_code(name):
+    """Returns ``(code, base, number)`` for the first model code in a product name, or Nones."""
+    match = MODEL_CODE.search(_ascii(name or '').upper())
+    if match is None:
+        return None, None, None
+    prefix, number, suffix = match.groups()
+    return f"{prefix}{number}{suffix}", f"{prefix}{number}", number
+
+
+def name_grams(name, brand):
+    """Padded character trigrams of the descriptive words of a name (model code, brand and stopwords removed)."""
+    text = MODEL_CODE.sub(' ', _ascii(name or '').upper()).lower()
+    brand_words = set(brand_key(brand).split())
+    words = [
+        word for word in re.findall(r'[a-z0-9]+(?:\.[0-9]+)?', text)
+        if word not in NAME_STOPWORDS and word not in brand_words
+    ]
+    grams = set()
+    for word in words:
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def price_of(record):
+    """The price a shopper pays: the current (sale) price, else the list price."""
+    current = _value(record, 'current_price_cents')
+    return current if current is not None else _value(record, 'former_price_cents')
+
+
+def _value(record, name):
+    value = record.get(name) if isinstance(record, dict) else getattr(record, name, None)
+    return int(value) if name.endswith('_cents') and value not in (None, '') else value
+
+
+def match_item(record):
+    """Prepares a ProductRecord (or a dict with the same fields) for matching."""
+    brand, name = _value(record, 'brand'), _value(record, 'name')
+    code, base, number = model_code(name)
+    return MatchItem(
+        _value(record, 'site'), brand, name, price_of(record), brand_key(brand), code, base, number,
+        name_grams(name, brand),
+    )
+
+
+def dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+def similarity(a, b):
+    """Scores two products of the same brand family between 0 and 1.
+
+    Matching model codes decide (fit suffixes and the junior/adult prefix
+    may differ, at a lower score); different codes never match. Without a
+    code on both sides the descriptive names are compared.
+    """
+    if a.code and b.code:
+        if a.code == b.code:
+            score = 1.0
+        elif a.base == b.base:
+            score = 0.9
+        elif a.number == b.number:
+            score = 0.75
+        else:
+            return 0.0
+        # The name breaks ties between listings of the same code
+        names = 1.0 if not a.grams and not b.grams else dice(a.grams, b.grams)
+        return 0.9 * score + 0.1 * names
+    return 0.8 * dice(a.grams, b.grams)
+
+
+def _keys(item):
+    keys = [f"#{item.code}", f"#{item.base}", f"#{item.number}"] if item.code else []
+    return keys + list(item.grams)
+
+
+class MatchIndex:
+    """Inverted index of one vendor's products by code and trigram keys, blocked by brand family.
+
+    Keys shared by more than ``max_share`` of a block (and at least
+    ``min_postings`` products), such as the trigrams of "Wayfarer" in the
+    Ray-Ban block, are too common to find candidates with and are skipped
+    during lookup; they still count in the score.
+    """
+
+    def __init__(self, items, max_share=0.2, min_postings=20):
+        self.items = list(items)
+        self.blocks = defaultdict(lambda: defaultdict(list))
+        block_sizes = Counter()
+        for position, item in enumerate(self.items):
+            block_sizes[item.brand_key] += 1
+            block = self.blocks[item.brand_key]
+            for key in _keys(item):
+                block[key].append(position)
+        self.limits = {brand: max(min_postings, int(size * max_share)) for brand, size in block_sizes.items()}
+
+    def candidates(self, item, limit=10):
+        """Positions of the indexed products sharing the most keys with ``item``, best first."""
+        block = self.blocks.get(item.brand_key)
+        if not block:
+            return []
+        max_postings = self.limits[item.brand_key]
+        shared = Counter()
+        for key in _keys(item):
+            postings = block.get(key)
+            if postings and len(postings) <= max_postings:
+                shared.update(postings)
+        return [position for position, _ in shared.most_common(limit)]
+
+
+def collapse(items):
+    """Keeps one item per brand family and name, at its lowest price (listings per color or size)."""
+    cheapest = {}
+    for item in items:
+        key = (item.brand_key, ' '.join((item.name or '').lower().split()))
+        kept = cheapest.get(key)
+        if kept is None or (item.price_cents is not None and (kept.price_cents is None or item.price_cents < kept.price_cents)):
+            cheapest[key] = item
+    return list(cheapest.values())
+
+
+def match_products(left, right, threshold=0.5, candidates=10):
+    """Returns ``[(score, left_item, right_item), ...]``, each item matched at most once, best first."""
+    index = MatchIndex(right)
+    pairs = []
+    for i, item in enumerate(left):
+        for j in index.candidates(item, candidates):
+            score = similarity(item, index.items[j])
+            if score >= threshold:
+                pairs.append((score, i, j))
+    pairs.sort(key=lambda pair: -pair[0])
+    matched_left, matched_right, matches = set(), set(), []
+    for score, i, j in pairs:
+        if i in matched_left or j in matched_right:
+            continue
+        matched_left.add(i)
+        matched_right.add(j)
+        matches.append((score, left[i], index.items[j]))
+    return matches
+
+
+def comparison_rows(matches):
+    """Rows of the price comparison table for matched pairs, one per pair."""
+    rows = []
+    for score, a, b in matches:
+        difference = a.price_cents - b.price_cents if a.price_cents is not None and b.price_cents is not None else None
+        if difference is None:
+            cheaper = None
+        else:
+            cheaper = 'same' if difference == 0 else a.site if difference < 0 else b.site
+        rows.append({
+            'brand': a.brand,
+            'model': a.base or b.base,
+            'score': round(score, 3),
+            f"{a.site}_name": a.name,
+            f"{a.site}_price_cents": a.price_cents,
+            f"{b.site}_name": b.name,
+            f"{b.site}_price_cents": b.price_cents,
+            'difference_cents': difference,
+            'cheaper': cheaper,
+        })
+    rows.sort(key=lambda row: (row['brand'] or '', row['model'] or ''))
+    return rows
+
+
+def load_products(path, site=None):
+    """Reads ProductRecords from a JSON, JSON Lines or CSV export, in the current or the legacy schema.
+
+    Legacy rows carry no site; it is taken from ``site`` or the file name.
+    """
+    if site is None:
+        filename = os.path.basename(path)
+        site = next((name for name in ('framesdirect', 'glasses') if filename.startswith(name)), None)
+    with open(path, newline='', encoding='utf-8') as input_file:
+        if path.endswith('.csv'):
+            rows = list(csv.DictReader(input_file))
+        elif path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in input_file if line.strip()]
+        else:
+            rows = json.load(input_file)
+
+    records = []
+    for row in rows:
+        if 'current_price_cents' in row:
+            row = {key: (None if value == '' else value) for key, value in row.items()}
+            record = ProductRecord.from_dict(row)
+            if record.site is None:
+                record = ProductRecord.from_dict({**row, 'site': site})
+        else:
+            fields = {
+                FIELD_NAMES[key.lower().replace('_', ' ')]: value for key, value in row.items()
+                if key.lower().replace('_', ' ') in FIELD_NAMES
+            }
+            record = ProductRecord.from_strings(site, **{
+                'brand': None, 'name': None, 'current_price': None, 'former_price': None, 'discount': None, **fields,
+            })
+        records.append(record)
+    return records
+
+
+def save_comparison(rows, basename):
+    """Writes the comparison table as JSON and CSV."""
+    with open(f"{basename}.json", 'w') as json_file:
+        json.dump(rows, json_file, indent=4)
+    print(f"Data successfully saved to {basename}.json.")
+    if rows:
+        with open(f"{basename}.csv", 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Data successfully saved to {basename}.csv.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match products across vendors and compare their prices")
+    parser.add_argument('--left', default='./extracted_data/framesdirect_data.json', help="First vendor's export")
+    parser.add_argument('--right', default='./extracted_data/glasses_data.json', help="Second vendor's export")
+    parser.add_argument('--history', metavar='DB', help="Use the latest prices in this price history store instead of exports")
+    parser.add_argument('--sites', default='framesdirect,glasses', help="The two sites to compare, with --history")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Lowest match score kept (0-1)")
+    parser.add_argument('--output', default='./extracted_data/price_comparison', help="Output path without extension")
+    args = parser.parse_args()
+
+    if args.history:
+        from price_history import PriceHistory
+
+        history = PriceHistory(args.history)
+        left_site, right_site = args.sites.split(',')
+        left_records, right_records = history.latest(left_site), history.latest(right_site)
+        history.close()
+    else:
+        left_records, right_records = load_products(args.left), load_products(args.right)
+
+    left_items = collapse(match_item(record) for record in left_records)
+    right_items = collapse(match_item(record) for record in right_records)
+    matches = match_products(left_items, right_items, threshold=args.threshold)
+    print(f"Matched {len(matches)} of {len(left_items)} and {len(right_items)} distinct products.")
+    save_comparison(comparison_rows(matches), args.output)
@@ -0,0 +1,86 @@
+import hashlib
+import re
+from dataclasses import astuple, dataclass, fields
+from typing import Optional
+
+# Placeholders the extractors have historically written for missing values
+MISSING_VALUES = {'', 'N/A', 'None'}
+
+AMOUNT_PATTERN = re.compile(r'\d[\d,]*(?:\.\d+)?')
+
+
+def clean_text(value):
+    """Strips a scraped string and maps the missing-value placeholders to None."""
+    if value is None:
+        return None
+    value = value.strip()
+    return None if value in MISSING_VALUES else value
+
+
+def parse_cents(value):
+    """Parses a price string such as ``"$ 1,187.00"`` into integer cents, or None."""
+    match = AMOUNT_PATTERN.search(value or '')
+    if not match:
+        return None
+    dollars, _, fraction = match.group().replace(',', '').partition('.')
+    return int(dollars) * 100 + int((fraction + '00')[:2])
+
+
+def parse_percent(value):
+    """Parses a discount string such as ``"45% Off"`` into a number, or None."""
+    match = AMOUNT_PATTERN.search(value or '')
+    return float(match.group().replace(',', '')) if match else None
+
+
+@dataclass(frozen=True, slots=True)
+class ProductRecord:
+    """One product from a listing page, normalized at extraction time.
+
+    Prices are integer cents and the discount is a percentage, so records from
+    both vendors share one schema and hash cheaply. ``url`` is the product's
+    detail page; ``sku``, ``frame_size``, ``material`` and ``colors`` (comma
+    separated) are only filled in by the detail stage (see detail_pages).
+    """
+
+    site: str
+    brand: Optional[str]
+    name: Optional[str]
+    current_price_cents: Optional[int]
+    former_price_cents: Optional[int]
+    discount_pct: Optional[float]
+    first_badge: Optional[str] = None
+    second_badge: Optional[str] = None
+    url: Optional[str] = None
+    sku: Optional[str] = None
+    frame_size: Optional[str] = None
+    material: Optional[str] = None
+    colors: Optional[str] = None
+
+    @classmethod
+    def from_strings(cls, site, brand, name, current_price, former_price, discount,
+                     first_badge=None, second_badge=None, url=None):
+        """Builds a record from the raw strings scraped off a page."""
+        return cls(
+            site=site,
+            brand=clean_text(brand),
+            name=clean_text(name),
+            current_price_cents=parse_cents(clean_text(current_price)),
+            former_price_cents=parse_cents(clean_text(former_price)),
+            discount_pct=parse_percent(clean_text(discount)),
+            first_badge=clean_text(first_badge),
+            second_badge=clean_text(second_badge),
+            url=clean_text(url),
+        )
+
+    @classmethod
+    def from_dict(cls, row):
+        """Rebuilds a record from :meth:`to_dict` output (e.g. a JSON Lines row)."""
+        return cls(**{field.name: row.get(field.name) for field in fields(cls)})
+
+    def to_dict(self):
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+    def digest(self):
+        """Stable hex digest of all fields, usable as a persistent dedup key."""
+        payload = '\x1f'.join('' if value is None else str(value) for value in astuple(self))
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
@@ -0,0 +1,245 @@
+"""Adaptive per-host pacing: AIMD concurrency and delay plus a circuit breaker.
+
+Each host starts at one request in flight. Every fast, successful response
+adds a little concurrency and shaves the delay; a slow response, timeout,
+429/503 or a block/captcha page halves the concurrency and doubles the
+delay. After ``trip_after`` bad outcomes in a row the circuit opens and the
+host gets no requests for a cooldown (or the server's ``Retry-After``),
+then a single probe decides whether to close it again. A host whose
+circuit keeps tripping without a success in between is treated as blocking
+us, and further requests fail fast with HostBlocked so the crawl can stop
+and be resumed later instead of digging the hole deeper.
+"""
+import asyncio
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
+
+import crawl_metrics
+
+# Markers of bot walls and captcha interstitials seen on retail sites
+BLOCK_SIGNATURES = re.compile(
+    r'captcha|are you a (?:robot|human)|access denied|request unsuccessful|unusual traffic'
+    r'|cdn-cgi/challenge-platform|px-captcha|_incapsula_resource|please verify you are a human',
+    re.IGNORECASE,
+)
+
+OUTCOMES = ('ok', 'slow', 'timeout', 'throttled', 'blocked', 'error')
+
+
+def looks_blocked(html_source):
+    """True if a page looks like a bot wall rather than a catalog page."""
+    return bool(html_source) and BLOCK_SIGNATURES.search(html_source) is not None
+
+
+class HostBlocked(Exception):
+    """Raised instead of sending a request to a host whose circuit keeps tripping."""
+
+
+class PageBlocked(Exception):
+    """Raised by a browser fetch that landed on a bot wall instead of the catalog."""
+
+
+class HostController:
+    """Concurrency limit, delay and circuit state for one host."""
+
+    def __init__(self, host, max_concurrency=4, delay=1.0, min_delay=0.0, max_delay=60.0, target_latency=5.0,
+                 trip_after=3, cooldown=30.0, max_trips=4):
+        self.host = host
+        self.max_concurrency = max_concurrency
+        self.limit = 1.0
+        self.delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.target_latency = target_latency
+        self.trip_after = trip_after
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_trips = max_trips
+
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.failures = 0
+        self.trips = 0
+        self.open_until = None
+        self.probing = False
+        self.condition = threading.Condition()
+
+    def try_acquire(self, now=None):
+        """Takes a slot and returns 0, or returns how long to wait before trying again."""
+        now = time.monotonic() if now is None else now
+        with self.condition:
+            if self.trips >= self.max_trips:
+                raise HostBlocked(f"{self.host} keeps refusing requests; giving up for now")
+            if self.open_until is not None:
+                if now < self.open_until:
+                    return self.open_until - now
+                if self.probing:
+                    return 0.25
+            elif self.in_flight >= max(1, int(self.limit)):
+                return 0.05
+            if now < self.next_start:
+                return self.next_start - now
+            if self.open_until is not None:
+                # Half-open: a single probe decides whether the circuit closes
+                self.probing = True
+            self.in_flight += 1
+            self.next_start = now + self.delay
+            return 0
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def cancel_probe(self):
+        """Gives up a half-open probe that never reached the host, leaving the pacing as it was."""
+        with self.condition:
+            self.probing = False
+            self.condition.notify_all()
+
+    def record(self, outcome, latency=None, retry_after=None):
+        """Adjusts the pacing after a response (``outcome`` is one of OUTCOMES)."""
+        if outcome == 'ok' and latency is not None and latency > self.target_latency:
+            outcome = 'slow'
+        with self.condition:
+            was_probe = self.probing
+            self.probing = False
+            if outcome == 'ok':
+                # Additive increase: about one more request in flight per window of successes
+                self.limit = min(self.max_concurrency, self.limit + 1 / max(self.limit, 1))
+                self.delay = max(self.min_delay, self.delay * 0.9)
+                self._close()
+                self.trips = 0
+                self.cooldown = self.base_cooldown
+            elif outcome == 'slow':
+                # Slow but answering: ease off without counting it as a failure
+                self.limit = max(1.0, self.limit * 0.75)
+                self.delay = min(self.max_delay, max(self.delay, 0.25) * 1.25)
+                self._close()
+            else:
+                # Multiplicative decrease
+                self.limit = max(1.0, self.limit / 2)
+                self.delay = min(self.max_delay, max(self.delay, 0.5) * 2)
+                if retry_after:
+                    self.delay = min(self.max_delay, max(self.delay, retry_after))
+                self.failures += 1
+                if was_probe or self.failures >= self.trip_after:
+                    self._trip(retry_after)
+            self.condition.notify_all()
+
+    def _close(self):
+        self.failures = 0
+        if self.open_until is not None:
+            print(f"Circuit for {self.host} closed again.")
+            self.open_until = None
+
+    def _trip(self, retry_after=None):
+        cooldown = max(self.cooldown, retry_after or 0)
+        self.open_until = time.monotonic() + cooldown
+        self.trips += 1
+        self.failures = 0
+        # Each trip without a success in between waits twice as long
+        self.cooldown = min(self.cooldown * 2, 600)
+        print(f"Circuit for {self.host} opened for {cooldown:.0f}s (trip {self.trips}/{self.max_trips}).")
+        crawl_metrics.error('circuit_open', self.host, f"cooldown {cooldown:.0f}s")
+
+    def stats(self):
+        return {'limit': round(self.limit, 2), 'delay': round(self.delay, 3), 'in_flight': self.in_flight,
+                'open': self.open_until is not None, 'trips': self.trips}
+
+
+class RateController:
+    """Per-host AIMD pacing for every fetch backend.
+
+    Use ``slot(url)`` around a blocking request or ``aslot(url)`` around an
+    asyncio one, then ``record(url, outcome, latency)`` once its outcome is
+    known, or ``cancel_probe(url)`` if the request was never sent. Keyword
+    arguments are passed to each host's HostController.
+    """
+
+    def __init__(self, **host_options):
+        self.host_options = host_options
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            controller = self.hosts.get(host)
+            if controller is None:
+                controller = self.hosts[host] = HostController(host, **self.host_options)
+            return controller
+
+    @contextmanager
+    def slot(self, url):
+        controller = self.host(url)
+        while True:
+            wait = controller.try_acquire()
+            if not wait:
+                break
+            with controller.condition:
+                controller.condition.wait(timeout=wait)
+        try:
+            yield controller
+        finally:
+            controller.release()
+
+    @asynccontextmanager
+    async def aslot(self, url):
+        controller = self.host(url)
+        while True:
+            wait = controller.try_acquire()
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        try:
+            yield controller
+        finally:
+            controller.release()
+
+    def record(self, url, outcome, latency=None, retry_after=None):
+        self.host(url).record(outcome, latency, retry_after)
+
+    def cancel_probe(self, url):
+        self.host(url).cancel_probe()
+
+
+def classify_response(status, html_source=None, is_complete=None):
+    """Maps an HTTP status and body to a RateController outcome.
+
+    A page that ``is_complete`` accepts is never treated as a bot wall, so a
+    catalog page that merely mentions a captcha (a newsletter form, say)
+    does not slow the crawl down.
+    """
+    if status in (429, 503):
+        return 'throttled'
+    if status == 403:
+        return 'blocked'
+    if status is not None and status >= 500:
+        return 'error'
+    if html_source is None:
+        return 'error'
+    if not (is_complete is not None and is_complete(html_source)) and looks_blocked(html_source):
+        return 'blocked'
+    return 'ok'
+
+
+def classify_exception(error):
+    """Maps an exception raised while fetching to a RateController outcome."""
+    if isinstance(error, PageBlocked):
+        return 'blocked'
+    if 'Timeout' in type(error).__name__:
+        # selenium's TimeoutException, httpx's ReadTimeout/ConnectTimeout/...
+        return 'timeout'
+    return 'error'
+
+
+def retry_after_seconds(value):
+    """Parses a numeric ``Retry-After`` header (HTTP dates are ignored)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
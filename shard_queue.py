@@ -0,0 +1,213 @@
+"""Lease queue of crawl work units on a shared file, for sharded crawls.
+
+A coordinator splits a crawl into work units (a range of numbered listing
+pages, or one facet of a catalog that paginates with a cursor) and adds
+them to a ShardQueue. Workers on any machine that can reach the file lease
+one unit at a time, crawl it into a shard file of their own and mark it
+done. A unit whose lease runs out because its worker died or lost the share
+is handed to the next worker that asks. Once every unit is finished, the
+shards of the done units are merged and deduplicated into the final dataset.
+
+The queue is a SQLite database in rollback-journal mode. WAL needs shared
+memory and only works on one machine, while a rollback journal relies on
+file locks alone, which a network share with working POSIX locks provides.
+Every state change is a short ``BEGIN IMMEDIATE`` transaction, so two
+workers never lease the same unit. Leases are compared against each
+worker's wall clock, so the lease should be much longer than the clock skew
+between machines.
+
+    python framesdirect_pag.py --shard plan --shard-queue /mnt/crawl/fd.queue --unit-pages 5
+    python framesdirect_pag.py --shard work --shard-queue /mnt/crawl/fd.queue    # on each machine
+    python framesdirect_pag.py --shard merge --shard-queue /mnt/crawl/fd.queue
+"""
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+# One work unit: crawled from ``urls``; 'pages' units fetch exactly those
+# pages, 'cursor' units follow the pagination from them to the end
+WorkUnit = namedtuple('WorkUnit', ['unit_id', 'kind', 'urls'])
+
+UNIT_KINDS = ('pages', 'cursor')
+UNIT_STATUSES = ('pending', 'leased', 'done', 'failed')
+
+
+def shard_dir(queue_path):
+    """Directory next to the queue file that holds the shards.
+
+    Shards are recorded relative to it, so machines that mount the share at
+    different paths still find each other's shards.
+    """
+    root, _ = os.path.splitext(queue_path)
+    return f"{root}_shards"
+
+
+class ShardQueue:
+    """Work units of one sharded crawl and their leases, in a shared SQLite file."""
+
+    def __init__(self, path, max_attempts=3, timeout=60.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.shard_dir = shard_dir(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Autocommit mode; every change below opens its own immediate transaction
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.db.executescript("""
+            PRAGMA journal_mode = DELETE;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS units (
+                unit_id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                urls TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                shard TEXT,
+                rows INTEGER,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS units_status_seq ON units(status, seq);
+        """)
+
+    def _transaction(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def site(self):
+        return self._meta('site')
+
+    @property
+    def crawl_id(self):
+        return self._meta('crawl_id')
+
+    def plan(self, site, crawl_id, units):
+        """Replaces the queue with ``units`` (WorkUnits) for a new crawl.
+
+        Refuses while units of the previous crawl are still pending or leased.
+        """
+        units = list(units)
+        for unit in units:
+            if unit.kind not in UNIT_KINDS:
+                raise ValueError(f"Unknown unit kind {unit.kind!r}, expected one of {UNIT_KINDS}")
+        db = self._transaction()
+        try:
+            unfinished = db.execute("SELECT COUNT(*) FROM units WHERE status IN ('pending', 'leased')").fetchone()[0]
+            if unfinished:
+                raise ValueError(
+                    f"{self.path} still has {unfinished} unfinished unit(s) of crawl {self._meta('crawl_id')}; "
+                    f"finish or delete it first"
+                )
+            db.execute("DELETE FROM units")
+            db.execute("DELETE FROM meta")
+            db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [('site', site), ('crawl_id', crawl_id)])
+            db.executemany(
+                "INSERT INTO units (unit_id, seq, kind, urls) VALUES (?, ?, ?, ?)",
+                [(unit.unit_id, seq, unit.kind, json.dumps(list(unit.urls))) for seq, unit in enumerate(units)],
+            )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+    def lease(self, worker, lease_seconds=600.0):
+        """Leases the next pending (or abandoned) unit to ``worker``; returns a WorkUnit or None."""
+        now = time.time()
+        db = self._transaction()
+        try:
+            # Units whose leases ran out too often are given up on rather than retried forever
+            db.execute(
+                "UPDATE units SET status = 'failed', error = 'lease expired ' || attempts || ' time(s)' "
+                "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            row = db.execute(
+                "SELECT unit_id, kind, urls FROM units "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) ORDER BY seq LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE units SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                    "WHERE unit_id = ?",
+                    (worker, now + lease_seconds, row[0]),
+                )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        if row is None:
+            return None
+        return WorkUnit(row[0], row[1], json.loads(row[2]))
+
+    def _update_lease(self, sql, params):
+        db = self._transaction()
+        try:
+            cursor = db.execute(sql, params)
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return cursor.rowcount == 1
+
+    def renew(self, unit_id, worker, lease_seconds=600.0):
+        """Extends ``worker``'s lease; False if the lease was lost to another worker."""
+        return self._update_lease(
+            "UPDATE units SET lease_until = ? WHERE unit_id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + lease_seconds, unit_id, worker),
+        )
+
+    def complete(self, unit_id, worker, shard, rows):
+        """Marks a unit done with its shard (relative to ``shard_dir``); False if the lease was lost."""
+        return self._update_lease(
+            "UPDATE units SET status = 'done', lease_until = NULL, shard = ?, rows = ?, error = NULL "
+            "WHERE unit_id = ? AND worker = ? AND status = 'leased'",
+            (shard, rows, unit_id, worker),
+        )
+
+    def release(self, unit_id, worker, error=None):
+        """Hands a unit back for another attempt, or fails it once it has used up its attempts."""
+        return self._update_lease(
+            "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, lease_until = NULL, error = ? WHERE unit_id = ? AND worker = ? AND status = 'leased'",
+            (self.max_attempts, error, unit_id, worker),
+        )
+
+    def counts(self):
+        """Number of units per status."""
+        counts = dict.fromkeys(UNIT_STATUSES, 0)
+        counts.update(self.db.execute("SELECT status, COUNT(*) FROM units GROUP BY status"))
+        return counts
+
+    def finished(self):
+        counts = self.counts()
+        return counts['pending'] == 0 and counts['leased'] == 0
+
+    def units(self):
+        """Every unit as a dict, in plan order."""
+        cursor = self.db.execute(
+            "SELECT unit_id, kind, status, worker, lease_until, attempts, shard, rows, error FROM units ORDER BY seq"
+        )
+        return [dict(zip([column[0] for column in cursor.description], row)) for row in cursor]
+
+    def done_shards(self):
+        """``(unit_id, shard path)`` of the done units, in plan order."""
+        return [
+            (row[0], os.path.join(self.shard_dir, row[1]))
+            for row in self.db.execute("SELECT unit_id, shard FROM units WHERE status = 'done' ORDER BY seq")
+        ]
+
+    def close(self):
+        self.db.close()
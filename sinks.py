@@ -0,0 +1,207 @@
+import csv
+import hashlib
+import json
+import os
+
+
+def record_hash(record):
+    """Returns a stable hash for a product record (a ProductRecord or a plain dict)."""
+    if hasattr(record, 'digest'):
+        return record.digest()
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def to_row(record):
+    """Returns the dict written to the output files for a record."""
+    return record.to_dict() if hasattr(record, 'to_dict') else record
+
+
+class DedupIndex:
+    """On-disk set of record hashes, one hex digest per line."""
+
+    def __init__(self, path, reset=False):
+        self.path = path
+        self.seen = set()
+        if reset and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as index_file:
+                self.seen.update(line.strip() for line in index_file if line.strip())
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def add(self, key):
+        """Records a key and returns True if it had not been seen before."""
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        self.file.write(key + '\n')
+        return True
+
+    def __len__(self):
+        return len(self.seen)
+
+    def flush(self, sync=False):
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesWriter:
+    """Appends one JSON object per line."""
+
+    def __init__(self, path, reset=False):
+        self.path = path
+        self.file = open(path, 'w' if reset else 'a', encoding='utf-8')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self, sync=False):
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class CsvAppendWriter:
+    """Appends rows to a CSV file, writing the header only once."""
+
+    def __init__(self, path, reset=False):
+        self.path = path
+        self.file = open(path, 'w' if reset else 'a', newline='', encoding='utf-8')
+        self.has_header = self.file.tell() > 0
+        self.writer = None
+
+    def write(self, record):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(record.keys()))
+            if not self.has_header:
+                self.writer.writeheader()
+                self.has_header = True
+        self.writer.writerow(record)
+
+    def flush(self, sync=False):
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class StreamingSink:
+    """Appends each page's new rows to JSON Lines and CSV files.
+
+    Rows already written (in this run or, when resuming, in an earlier one)
+    are skipped using the on-disk dedup index, so the cost of a page is only
+    the rows it adds. Every ``checkpoint_every`` pages the files are fsync'd.
+
+    When resuming, ``offsets`` (as returned by :meth:`offsets`) truncates the
+    files back to the last recorded page so rows from a page that was
+    interrupted mid-write are not duplicated.
+
+    ``key`` maps a record to its dedup key; by default the whole record is
+    hashed, pass an identity key to keep only the first row per product.
+    Rows that pass dedup are also handed to each of ``mirrors`` (e.g. a
+    ColumnarSink), which the caller closes.
+    """
+
+    def __init__(self, basename, checkpoint_every=10, resume=False, offsets=None, key=record_hash, mirrors=()):
+        self.basename = basename
+        self.key = key
+        self.mirrors = list(mirrors)
+        self.jsonl_filename = f"{basename}.jsonl"
+        self.csv_filename = f"{basename}.csv"
+        self.index_filename = f"{basename}.idx"
+        self.checkpoint_every = checkpoint_every
+        self.pages_since_checkpoint = 0
+        reset = not resume
+        if resume and offsets:
+            self._truncate(offsets)
+        self.index = DedupIndex(self.index_filename, reset=reset)
+        self.jsonl = JsonLinesWriter(self.jsonl_filename, reset=reset)
+        self.csv = CsvAppendWriter(self.csv_filename, reset=reset)
+
+    def _filenames(self):
+        return {'jsonl': self.jsonl_filename, 'csv': self.csv_filename, 'index': self.index_filename}
+
+    def _truncate(self, offsets):
+        for name, filename in self._filenames().items():
+            offset = offsets.get(name)
+            if offset is not None and os.path.exists(filename) and os.path.getsize(filename) > offset:
+                with open(filename, 'r+b') as output_file:
+                    output_file.truncate(offset)
+
+    def offsets(self):
+        """Returns the current size of each output file."""
+        self.flush()
+        return {
+            'jsonl': self.jsonl.file.tell(),
+            'csv': self.csv.file.tell(),
+            'index': self.index.file.tell(),
+        }
+
+    def write_page(self, records):
+        """Writes the unseen records of one page and returns how many were new."""
+        new_records = []
+        for record in records:
+            if not self.index.add(self.key(record)):
+                continue
+            row = to_row(record)
+            self.jsonl.write(row)
+            self.csv.write(row)
+            new_records.append(record)
+        for mirror in self.mirrors:
+            mirror.write_page(new_records)
+
+        self.pages_since_checkpoint += 1
+        if self.pages_since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+        else:
+            self.flush()
+        return len(new_records)
+
+    def flush(self, sync=False):
+        for writer in (self.jsonl, self.csv, self.index):
+            writer.flush(sync=sync)
+
+    def checkpoint(self):
+        """Flushes and fsyncs all output files."""
+        self.flush(sync=True)
+        self.pages_since_checkpoint = 0
+
+    def close(self):
+        self.checkpoint()
+        for writer in (self.jsonl, self.csv, self.index):
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_jsonl(jsonl_filename):
+    """Yields records from a JSON Lines file."""
+    with open(jsonl_filename, 'r', encoding='utf-8') as jsonl_file:
+        for line in jsonl_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def export_json(jsonl_filename, json_filename):
+    """Writes the final JSON export from the streamed JSON Lines file."""
+    if not os.path.exists(jsonl_filename):
+        print("No data to save.")
+        return
+
+    with open(json_filename, 'w') as json_file:
+        json.dump(list(iter_jsonl(jsonl_filename)), json_file, indent=4)
+    print(f"Data successfully saved to {json_filename}.")
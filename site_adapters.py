@@ -0,0 +1,208 @@
+"""Declarative specs for the vendors the scrapers support.
+
+A SiteAdapter says where the products are on a listing page, which element
+holds each ProductRecord field, how to reach the next page and when a page
+has rendered. Its DetailSpec does the same for the product pages the tiles
+link to. ``site_engine`` runs every adapter the same way, so adding a
+vendor is a new spec here plus a two-line script that calls
+``site_engine.main``.
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from page_pipeline import Selector, class_strainer
+
+
+def start_tag_pattern(selector):
+    """Regex for the raw start tag of the last step of ``selector`` (its tag and first class)."""
+    tag, classes, _ = selector.steps[-1]
+    tag_pattern = re.escape(tag) if tag else r'[a-zA-Z][\w-]*'
+    class_pattern = re.escape(sorted(classes)[0])
+    return re.compile(rf'<{tag_pattern}\b[^>]*\bclass=["\'][^"\']*(?<![\w-]){class_pattern}(?![\w-])')
+
+
+@dataclass(frozen=True, eq=False)
+class Pagination:
+    """How a listing page links to the next one.
+
+    ``next`` selects the element carrying the next page's URL in its
+    ``attr`` attribute (resolved against the site's base URL). When pages
+    are numbered by the ``page_param`` query parameter and the page links
+    show the last number, the engine can fan out over every page at once.
+
+    A ``cumulative`` (load-more) pagination renders every earlier tile again
+    on each next page; the engine then parses only the tiles past its
+    high-water mark. ``fragment_headers`` are request headers under which
+    the next-page URL answers with just the appended tiles, fetched from
+    inside the loaded page (or over plain HTTP) instead of reloading it.
+    """
+
+    next: str
+    attr: str = 'href'
+    page_param: Optional[str] = None
+    cumulative: bool = False
+    fragment_headers: Optional[dict] = None
+    next_selector: Selector = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'next_selector', Selector(self.next))
+
+
+@dataclass(frozen=True, eq=False)
+class DetailSpec:
+    """Where a vendor's product pages show the attributes the detail stage extracts.
+
+    The page's schema.org Product data (JSON-LD) is read first. ``fields``
+    maps the attributes it lacks (``sku``, ``frame_size``, ``material``)
+    to selectors whose first match's text is taken, and ``lists`` maps
+    ``colors`` to a selector of swatches, each named by its text or its
+    ``title``/``aria-label``. A page is a product page once ``ready`` is
+    present.
+    """
+
+    ready: str
+    fields: dict = field(default_factory=dict)
+    lists: dict = field(default_factory=dict)
+    field_selectors: dict = field(init=False)
+    list_selectors: dict = field(init=False)
+    parse_only: object = field(init=False)
+
+    def __post_init__(self):
+        field_selectors = {name: Selector(css) for name, css in self.fields.items()}
+        list_selectors = {name: Selector(css) for name, css in self.lists.items()}
+        object.__setattr__(self, 'field_selectors', field_selectors)
+        object.__setattr__(self, 'list_selectors', list_selectors)
+        # Partial parsing keeps the subtrees the selectors start from, unless one starts from a bare tag
+        outer_classes = [selector.outer_classes for selector in (*field_selectors.values(), *list_selectors.values())]
+        parse_only = None
+        if outer_classes and all(outer_classes):
+            parse_only = class_strainer(*set().union(*outer_classes))
+        object.__setattr__(self, 'parse_only', parse_only)
+
+    @property
+    def ready_class(self):
+        return sorted(Selector(self.ready).steps[-1][1])[0]
+
+
+@dataclass(frozen=True, eq=False)
+class SiteAdapter:
+    """One vendor's listing pages, described by selectors.
+
+    ``fields`` maps ProductRecord field names (``brand``, ``name``,
+    ``current_price``, ``former_price``, ``discount``, ``first_badge``,
+    ``second_badge``) to selectors relative to each ``container``. Pages
+    are ready once ``ready`` is present and the container count settles.
+    Selectors are compiled once, when the spec is created.
+    """
+
+    site: str
+    base_url: str
+    start_path: str
+    container: str
+    fields: dict
+    pagination: Pagination
+    ready: str
+    link: Optional[str] = None
+    details: Optional[DetailSpec] = None
+    container_selector: Selector = field(init=False)
+    link_selector: Optional[Selector] = field(init=False)
+    field_selectors: dict = field(init=False)
+    fields_by_tag: dict = field(init=False)
+    parse_only: object = field(init=False)
+    tile_pattern: object = field(init=False)
+    next_pattern: object = field(init=False)
+
+    def __post_init__(self):
+        field_selectors = {name: Selector(css) for name, css in self.fields.items()}
+        # Candidate fields per tag name, so one walk over a container fills every field
+        fields_by_tag = defaultdict(list)
+        for name, selector in field_selectors.items():
+            fields_by_tag[selector.tag].append((name, selector))
+        container_selector = Selector(self.container)
+        object.__setattr__(self, 'container_selector', container_selector)
+        object.__setattr__(self, 'field_selectors', field_selectors)
+        object.__setattr__(self, 'fields_by_tag', dict(fields_by_tag))
+        object.__setattr__(self, 'link_selector', Selector(self.link) if self.link else None)
+        # Partial parsing: only the product containers and the pagination element are built
+        object.__setattr__(self, 'parse_only', class_strainer(
+            *container_selector.outer_classes, *self.pagination.next_selector.outer_classes
+        ))
+        # Raw start tags of the product containers and the next-page element, found without parsing
+        object.__setattr__(self, 'tile_pattern', start_tag_pattern(container_selector))
+        object.__setattr__(self, 'next_pattern', start_tag_pattern(self.pagination.next_selector))
+
+    @property
+    def start_url(self):
+        return f"{self.base_url}{self.start_path}"
+
+    @property
+    def marker_class(self):
+        """A class every product container carries, for cheap unparsed checks."""
+        return sorted(self.container_selector.steps[-1][1])[0]
+
+    @property
+    def ready_class(self):
+        """A class of the ``ready`` element, which full pages have and load-more fragments lack."""
+        return sorted(Selector(self.ready).steps[-1][1])[0]
+
+
+FRAMESDIRECT = SiteAdapter(
+    site='framesdirect',
+    base_url='https://www.framesdirect.com',
+    start_path='/eyeglasses?',
+    container='div.prod-holder',
+    fields={
+        'brand': 'div.prod-title div.catalog-name',
+        'name': 'div.prod-title div.product_name',
+        'current_price': 'div.prod-price-wrap div.prod-aslowas',
+        'former_price': 'div.prod-price-wrap div.prod-catalog-retail-price',
+        'discount': 'div.frame-discount',
+    },
+    pagination=Pagination(next='a.ml-1[href]', attr='href', page_param='p'),
+    ready='.fd-cat',
+    link='a[href]',
+    details=DetailSpec(
+        ready='.pdp-container',
+        fields={
+            'sku': 'div.product-info span.product-sku',
+            'frame_size': 'div.frame-specs div.frame-size',
+            'material': 'div.frame-specs div.frame-material',
+        },
+        lists={'colors': 'div.color-swatches a.swatch'},
+    ),
+)
+
+GLASSES = SiteAdapter(
+    site='glasses',
+    base_url='https://www.glasses.com',
+    start_path='/gl-us/eyeglasses?',
+    container='a.product-tile',
+    fields={
+        'brand': 'div.product-info div.product-brand',
+        'name': 'div.product-info div.product-code',
+        'first_badge': 'div.product-top div.product-badge.first-badge',
+        'second_badge': 'div.product-top div.product-badge.second-badge',
+        'former_price': 'div.product-prices div.product-list-price',
+        'current_price': 'div.product-prices div.product-offer-price',
+        'discount': 'div.product-badge.discount-badge.thirty',
+    },
+    pagination=Pagination(
+        next='div.load-more-wrapper[data-filter-url]', attr='data-filter-url', cumulative=True,
+        fragment_headers={'X-Requested-With': 'XMLHttpRequest'},
+    ),
+    ready='.catalog-page',
+    link='a.product-tile[href]',
+    details=DetailSpec(
+        ready='.pdp-main',
+        fields={
+            'sku': 'div.pdp-details div.product-upc',
+            'frame_size': 'div.pdp-details div.frame-size-value',
+            'material': 'div.pdp-details div.frame-material-value',
+        },
+        lists={'colors': 'div.color-selector button.color-swatch'},
+    ),
+)
+
+ADAPTERS = {adapter.site: adapter for adapter in (FRAMESDIRECT, GLASSES)}
@@ -0,0 +1,1010 @@
+"""The crawl engine shared by every SiteAdapter.
+
+Browser setup, fetching, extraction, pagination, dedup, output and the
+command line are the same for every vendor; only the adapter differs.
+"""
+import argparse
+import csv
+import dataclasses
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import time
+from functools import partial
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+import crawl_metrics
+import driver_setup
+import page_pipeline
+from columnar_sink import COLUMNAR_FORMATS, ColumnarSink
+from crawl_metrics import CrawlMetrics
+from crawl_scheduler import CrawlScheduler, WebDriverPool
+from crawl_state import CrawlState
+from dedup_store import IDENTITY_FIELDS, DedupStore, identity_key
+from detail_pages import DetailFetcher, DetailStore
+from fetch_backends import FETCH_MODES, USER_AGENT, PageFetcher, has_class
+from page_fingerprints import FingerprintStore, page_fingerprint
+from parse_workers import ParsePool
+from pipeline import (
+    CrawlPage, carry_forward, classify_pages, enrich_pages, iter_records, record_fingerprints, record_prices, run_pipeline, track_state,
+    write_pages,
+)
+from price_history import PriceHistory
+from product_record import ProductRecord
+from rate_control import PageBlocked, RateController, looks_blocked
+from shard_queue import ShardQueue, WorkUnit
+from sinks import StreamingSink, export_json, iter_jsonl
+from snapshot_cache import SnapshotCache
+
+DEDUP_FILENAME = './extracted_data/dedup.sqlite'
+PRICE_HISTORY_FILENAME = './extracted_data/price_history.sqlite'
+FINGERPRINT_FILENAME = './extracted_data/page_fingerprints.sqlite'
+DETAIL_FILENAME = './extracted_data/product_details.sqlite'
+COLUMNAR_ROOT = './extracted_data/columnar'
+
+# Fetches a load-more URL from inside the loaded page, so the browser does not re-render the catalog
+FRAGMENT_SCRIPT = """
+const [url, headers, done] = arguments;
+fetch(url, {headers: headers, credentials: 'same-origin'})
+    .then(response => response.ok ? response.text() : null)
+    .then(done, () => done(null));
+"""
+
+
+def output_basename(adapter):
+    return f"./extracted_data/{adapter.site}_data"
+
+
+def state_filename(adapter):
+    return f"./extracted_data/{adapter.site}_crawl_state.json"
+
+
+def queue_filename(adapter):
+    return f"./extracted_data/{adapter.site}.queue"
+
+
+def setup_webdriver(debugger_address=None, profile='lean'):
+    """Sets up and returns a configured Selenium WebDriver.
+
+    With ``debugger_address`` (``host:port``) the driver attaches to an
+    already running Chrome instead of starting a new one. ``profile`` is a
+    driver_setup load profile.
+    """
+    print("Setting up WebDriver...")
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument(f"user-agent={USER_AGENT}")
+    driver_setup.apply_load_profile(chrome_options, profile)
+    if debugger_address:
+        driver_setup.attach_to(chrome_options, debugger_address)
+
+    with crawl_metrics.stage('webdriver_startup'):
+        driver = driver_setup.start_chrome(chrome_options)
+        if debugger_address:
+            # The attached browser ignores the user-agent argument above
+            driver_setup.override_user_agent(driver, USER_AGENT)
+        driver_setup.block_resources(driver, profile)
+    return driver
+
+
+def webdriver_factory(attach=None, profile='lean'):
+    """Driver factory for the pool; with ``attach`` each new driver takes the next browser address."""
+    if not attach:
+        return partial(setup_webdriver, profile=profile)
+    addresses = itertools.cycle(attach)
+    return lambda: setup_webdriver(next(addresses), profile=profile)
+
+
+def fetch_fragment(adapter, driver, url):
+    """Fetches a load-more URL through the page already loaded in ``driver``; None if that yields no tiles."""
+    with crawl_metrics.stage('fragment_fetch'):
+        try:
+            html_source = driver.execute_async_script(FRAGMENT_SCRIPT, url, adapter.pagination.fragment_headers)
+        except WebDriverException:
+            return None
+    return html_source if html_source and has_products(adapter, html_source) else None
+
+
+def fetch_page(adapter, driver, url):
+    """Loads a listing page and returns its source once the catalog has rendered.
+
+    Next pages of a site with ``fragment_headers`` are first requested from
+    inside the current page; a full reload is the fallback.
+    """
+    if adapter.pagination.fragment_headers and url != adapter.start_url and driver.current_url.startswith(adapter.base_url):
+        html_source = fetch_fragment(adapter, driver, url)
+        if html_source is not None:
+            print(f"Fetched load-more fragment: {url}")
+            return html_source
+    print(f"Visiting URL: {url}")
+    with crawl_metrics.stage('driver_get'):
+        driver.get(url)
+    print("Waiting for products to load...")
+    with crawl_metrics.stage('wait'):
+        # Products render after DOMContentLoaded; wait until their count stops growing
+        try:
+            WebDriverWait(driver, 15, poll_frequency=0.25).until(
+                driver_setup.tile_count_settled(
+                    (By.CSS_SELECTOR, adapter.container), (By.CSS_SELECTOR, adapter.ready)
+                )
+            )
+        except TimeoutException:
+            if looks_blocked(driver.page_source):
+                raise PageBlocked(f"{url} returned a bot wall") from None
+            raise
+    with crawl_metrics.stage('page_source'):
+        return driver.page_source
+
+
+def fetch_detail_page(adapter, driver, url):
+    """Loads a product page in the browser and returns its source once the product has rendered."""
+    print(f"Visiting product page: {url}")
+    with crawl_metrics.stage('driver_get'):
+        driver.get(url)
+    with crawl_metrics.stage('wait'):
+        try:
+            WebDriverWait(driver, 15, poll_frequency=0.25).until(
+                lambda d: d.find_elements(By.CSS_SELECTOR, adapter.details.ready)
+            )
+        except TimeoutException:
+            if looks_blocked(driver.page_source):
+                raise PageBlocked(f"{url} returned a bot wall") from None
+            raise
+    with crawl_metrics.stage('page_source'):
+        return driver.page_source
+
+
+def _text(element):
+    return element.text.strip()
+
+
+def extract_fields(adapter, container):
+    """Returns ``{field: text}`` for one product container (missing fields are left out)."""
+    if not isinstance(container, Tag):
+        values = {}
+        for name, selector in adapter.field_selectors.items():
+            element = selector.select_one(container)
+            if element is not None:
+                values[name] = _text(element)
+        return values
+
+    # One walk over the container fills every field, instead of a search per field
+    values = {}
+    remaining = len(adapter.field_selectors)
+    wildcard = adapter.fields_by_tag.get(None, ())
+    for element in container.descendants:
+        if not isinstance(element, Tag):
+            continue
+        for name, selector in itertools.chain(adapter.fields_by_tag.get(element.name, ()), wildcard):
+            if name not in values and selector.matches(element, container):
+                values[name] = _text(element)
+                remaining -= 1
+        if not remaining:
+            break
+    return values
+
+
+def product_link(adapter, container):
+    """Absolute URL of the product page a container links to, or None."""
+    selector = adapter.link_selector
+    if selector is None:
+        return None
+    if isinstance(container, Tag):
+        element = container if selector.matches(container) else selector.select_one(container)
+    else:
+        element = selector.select_one(container)
+        if element is None and container.attrs.get('href'):
+            # selectolax only searches below the node; the container may be the link itself
+            element = container
+    href = element.attrs.get('href') if element is not None else None
+    return urljoin(adapter.base_url, href) if href else None
+
+
+def extract_products(adapter, html_source):
+    """Parses the HTML source (or an already parsed page) and extracts ProductRecords."""
+    soup = BeautifulSoup(html_source, "html.parser") if isinstance(html_source, str) else html_source
+    return [
+        ProductRecord.from_strings(adapter.site, **{
+            'brand': None, 'name': None, 'current_price': None, 'former_price': None, 'discount': None,
+            **extract_fields(adapter, container), 'url': product_link(adapter, container),
+        })
+        for container in adapter.container_selector.select(soup)
+    ]
+
+
+def find_next_url(adapter, soup):
+    """Returns the absolute URL of the next listing page, or None on the last page."""
+    pagination = adapter.pagination
+    element = pagination.next_selector.select_one(soup)
+    if element is None or not element.attrs.get(pagination.attr):
+        return None
+    return urljoin(adapter.base_url, element[pagination.attr])
+
+
+def find_page_count(adapter, html_source):
+    """Returns the highest page number linked from the pagination bar (1 if there is none)."""
+    param = adapter.pagination.page_param
+    if param is None:
+        return 1
+    page_links = BeautifulSoup(
+        html_source, "html.parser", parse_only=SoupStrainer('a', href=re.compile(rf'[?&]{re.escape(param)}=\d+'))
+    )
+    page_numbers = [
+        int(value)
+        for link in page_links.find_all('a', href=True)
+        for key, value in parse_qsl(urlsplit(link['href']).query)
+        if key == param and value.isdigit()
+    ]
+    return max(page_numbers, default=1)
+
+
+def page_url(adapter, template_url, page_number):
+    """Returns ``template_url`` with its page query parameter set to ``page_number``."""
+    param = adapter.pagination.page_param
+    parts = urlsplit(template_url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != param]
+    query.append((param, str(page_number)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def has_products(adapter, html_source):
+    """True if the page contains product containers (i.e. it was fully rendered)."""
+    return has_class(html_source, adapter.marker_class)
+
+
+def new_tiles(adapter, html_source, high_water):
+    """Cuts a cumulative load-more page down to the tiles after the first ``high_water``.
+
+    Returns the source from the first new tile on, or the whole source for a
+    fragment response (no ``ready`` element) and for a page that does not
+    repeat the earlier tiles.
+    """
+    if not high_water or not adapter.pagination.cumulative or not has_class(html_source, adapter.ready_class):
+        return html_source
+    first_new = next(itertools.islice(adapter.tile_pattern.finditer(html_source), high_water, None), None)
+    return html_source if first_new is None else html_source[first_new.start():]
+
+
+def process_page(adapter, html_source, backend="html.parser", high_water=0):
+    """Parses a page once and returns its products and the next page URL.
+
+    With a ``high_water`` mark only the tiles appended after that many are
+    parsed (see ``new_tiles``), so each load-more step costs the same.
+    """
+    new_source = new_tiles(adapter, html_source, high_water)
+    result = page_pipeline.process_page(
+        new_source, partial(extract_products, adapter), partial(find_next_url, adapter),
+        backend=backend, parse_only=adapter.parse_only,
+    )
+    if result.next_url is None and new_source is not html_source:
+        # The load-more element sits before the new tiles; look for it in the whole page
+        soup = page_pipeline.parse_html(
+            html_source, backend=backend,
+            parse_only=page_pipeline.class_strainer(*adapter.pagination.next_selector.outer_classes),
+        )
+        result = result._replace(next_url=find_next_url(adapter, soup))
+    return result
+
+
+def check_fingerprint(adapter, fingerprints, result, high_water=0):
+    """Fingerprints a fetched page and compares it with the previous run; returns a PageFingerprint."""
+    fingerprint = None
+    if result.status != 304:
+        fingerprint = page_fingerprint(adapter, new_tiles(adapter, result.html, high_water), result.html)
+    return fingerprints.check(result.url, fingerprint, result.status, result.validators, high_water)
+
+
+def crawl_needed(adapter, fetcher, fingerprints, sample_size):
+    """Fetches a sample of the pages seen before; True if any changed (or none is known yet).
+
+    The sampled pages are not cached: they are no part of the crawl's chain of pages.
+    """
+    urls = fingerprints.urls()
+    if not urls:
+        print("No page fingerprints from an earlier crawl; crawling everything.")
+        return True
+    # The first page is always sampled: that is where new products usually show up
+    first = [adapter.start_url] if adapter.start_url in urls else []
+    others = [url for url in urls if url != adapter.start_url]
+    sample = first + random.sample(others, min(len(others), max(sample_size - len(first), 0)))
+    changed = 0
+    fetcher = fetcher.uncached()
+    for result in fetcher.fetch_many(sample):
+        if fetcher.failed(result):
+            changed += 1
+        elif not check_fingerprint(adapter, fingerprints, result, fingerprints.high_water(result.url)).unchanged:
+            changed += 1
+    print(f"{changed} of {len(sample)} sampled page(s) changed since the last crawl.")
+    return changed > 0
+
+
+def parse_results(adapter, results, backend, count_pages, failed, parse_pool=None, high_water=None):
+    """Yields ``(result, parsed)`` for fetch results, in order.
+
+    ``parsed`` is ``(products, next_url, page_count)`` or None for a failed
+    fetch. With a ParsePool the work runs in worker processes while the
+    next pages are being fetched; otherwise it runs inline. ``high_water``
+    maps a load-more URL to the number of tiles seen before it.
+    """
+    high_water = high_water if high_water is not None else {}
+    if parse_pool is not None:
+        yield from parse_pool.imap(adapter, results, backend, count_pages, failed, high_water)
+        return
+    for result in results:
+        if failed(result):
+            yield result, None
+            continue
+        products_on_page, next_url = process_page(
+            adapter, result.html, backend=backend, high_water=high_water.get(result.url, 0)
+        )
+        page_count = find_page_count(adapter, result.html) if count_pages and next_url else 1
+        yield result, (products_on_page, next_url, page_count)
+
+
+def iter_pages(adapter, fetcher, start_urls, backend="html.parser", concurrent=False, fanned_out=False, parse_pool=None,
+               fingerprints=None, high_water=None):
+    """Crawls listing pages and yields a CrawlPage for each one as soon as it is extracted.
+
+    With ``concurrent`` and a numbered pagination the page count is read
+    from the first page and all remaining pages are queued at once. Pages
+    that still fail after the fetcher's retries are tried again in the next
+    round; the crawl stops when a round makes no progress. ``parse_pool``
+    moves parsing into worker processes (see parse_workers). Along a
+    cumulative load-more chain each page records how many tiles came
+    before the next one, so only new tiles are parsed; ``high_water`` gives
+    the marks of start URLs reached that way (from a resumed crawl's state).
+
+    With a FingerprintStore every page is fingerprinted; when it skips
+    unchanged pages, such a page is not parsed and yields no products, and
+    its next page and page count come from the previous run.
+    """
+    fan_out = concurrent and adapter.pagination.page_param is not None
+    pending = list(start_urls)
+    seen = set(pending)
+    high_water = dict(high_water or {})
+    checked = {}
+
+    def fingerprinted(results):
+        for result in results:
+            if not fetcher.failed(result):
+                checked[result.url] = check_fingerprint(adapter, fingerprints, result, high_water.get(result.url, 0))
+            yield result
+
+    def skipped(result):
+        entry = checked.get(result.url)
+        return fingerprints.skip_unchanged and entry is not None and entry.unchanged
+
+    while pending:
+        batch, pending = pending, []
+        progress = False
+        # Next pages along a load-more chain can be fetched as fragments
+        results = fetcher.fetch_many(batch, fragments=high_water)
+        failed = fetcher.failed
+        if fingerprints is not None:
+            results = fingerprinted(results)
+            failed = lambda result: fetcher.failed(result) or skipped(result)
+        parsed_pages = parse_results(
+            adapter, results, backend, fan_out and not fanned_out, failed, parse_pool, high_water,
+        )
+        for result, parsed in parsed_pages:
+            entry = checked.pop(result.url, None)
+            if parsed is None and not (entry is not None and entry.unchanged and fingerprints.skip_unchanged):
+                print(f"Could not load {result.url}; it stays pending.")
+                pending.append(result.url)
+                continue
+            progress = True
+
+            if parsed is None:
+                # Unchanged since the last crawl: nothing to extract
+                products_on_page, next_url, page_count = [], entry.next_url, entry.page_count
+                tiles = len(entry.identities)
+            else:
+                # Products and the next page link, extracted from the page source
+                products_on_page, next_url, page_count = parsed
+                tiles = len(products_on_page)
+                if entry is not None:
+                    entry = entry._replace(
+                        next_url=next_url, page_count=page_count, unchanged=False,
+                        identities=tuple(fingerprints.key(record) for record in products_on_page),
+                    )
+            next_urls, marks = [], None
+            if next_url and not fanned_out:
+                if page_count > 1:
+                    print(f"Found {page_count} pages. Fetching the rest concurrently...")
+                    next_urls = [page_url(adapter, next_url, n) for n in range(2, page_count + 1)]
+                    fanned_out = True
+                else:
+                    next_urls = [next_url]
+                    print(f"Found next page URL: {next_url}")
+                    if adapter.pagination.cumulative:
+                        high_water[next_url] = high_water.get(result.url, 0) + tiles
+                        marks = {next_url: high_water[next_url]}
+            elif not next_url:
+                print("No more pages found.")
+
+            yield CrawlPage(result.url, products_on_page, next_urls, next_url, result.backend, entry, marks)
+            for url in next_urls:
+                if url not in seen:
+                    seen.add(url)
+                    pending.append(url)
+
+        if not progress:
+            break
+
+
+def previous_rows(adapter, key, resumed=False):
+    """Rows of the last crawl's output by product identity, for carrying unchanged pages over.
+
+    A fresh crawl copies the output aside before truncating it, so a
+    resumed one still finds the rows of the crawl before it.
+    """
+    basename = output_basename(adapter)
+    previous_filename = f"{basename}.previous.jsonl"
+    if not resumed and os.path.exists(f"{basename}.jsonl"):
+        shutil.copyfile(f"{basename}.jsonl", previous_filename)
+    if not os.path.exists(previous_filename):
+        return {}
+    return {key(row): row for row in iter_jsonl(previous_filename)}
+
+
+def build_fetcher(adapter, fetch='selenium', browsers=1, delay=1.0, attach=None, profile='lean', rate='adaptive',
+                  min_delay=0.25, **fetcher_options):
+    """Returns ``(pool, fetcher)`` for crawling ``adapter``'s site.
+
+    With ``rate='adaptive'`` a RateController paces both backends, starting
+    at ``delay`` between requests and never going below ``min_delay``;
+    ``'fixed'`` keeps a constant ``delay``.
+    """
+    if adapter.pagination.page_param is None:
+        # A cursor chains pages, so a single browser is enough
+        browsers = 1
+    elif attach:
+        browsers = len(attach)
+    controller = None
+    if rate == 'adaptive':
+        http_concurrency = fetcher_options.get('http_concurrency', 8)
+        controller = RateController(
+            max_concurrency=browsers if fetch == 'selenium' else max(browsers, http_concurrency),
+            delay=delay, min_delay=min(min_delay, delay),
+        )
+    pool = WebDriverPool(webdriver_factory(attach, profile), size=browsers)
+    scheduler = CrawlScheduler(
+        pool, partial(fetch_page, adapter), max_per_host=browsers, delay=delay, limiter=controller
+    )
+    fetcher = PageFetcher(
+        fetch, scheduler, partial(has_products, adapter), controller=controller,
+        fragment_headers=adapter.pagination.fragment_headers, **fetcher_options
+    )
+    return pool, fetcher
+
+
+def build_detail_fetcher(adapter, pool, fetch='selenium', concurrency=8, max_age=7 * 86400, delay=1.0, rate='adaptive',
+                         min_delay=0.25, backend="html.parser"):
+    """Returns a DetailFetcher for ``adapter``'s product pages.
+
+    Product pages are requested over HTTP; unless ``fetch`` is 'http', the
+    ones that keep failing are loaded in the browsers of ``pool``. Their
+    pacing is adapted separately from the listing pages'.
+    """
+    controller = None
+    if rate == 'adaptive':
+        controller = RateController(max_concurrency=concurrency, delay=delay, min_delay=min(min_delay, delay))
+    browser = None
+    if fetch != 'http':
+        browser = CrawlScheduler(
+            pool, partial(fetch_detail_page, adapter), max_per_host=pool.size, delay=delay, limiter=controller
+        )
+    return DetailFetcher(
+        adapter.details, DetailStore(DETAIL_FILENAME, adapter.site), concurrency=concurrency, max_age=max_age,
+        controller=controller, browser=browser, backend=backend,
+    )
+
+
+def crawl_products(adapter, fetch='auto', browsers=1, delay=1.0, backend="html.parser", attach=None, profile='lean',
+                   parse_workers=0):
+    """Library entry point: yields product records page by page while the crawl runs."""
+    pool, fetcher = build_fetcher(adapter, fetch, browsers, delay, attach, profile)
+    parse_pool = ParsePool(parse_workers) if parse_workers > 0 else None
+    try:
+        pages = iter_pages(
+            adapter, fetcher, [adapter.start_url], backend=backend, concurrent=pool.size > 1 or fetch != 'selenium',
+            parse_pool=parse_pool,
+        )
+        yield from iter_records(pages)
+    finally:
+        if parse_pool is not None:
+            parse_pool.close()
+        fetcher.close()
+        pool.close()
+
+
+def replay_snapshots(adapter, cache, crawl_id, backend="html.parser"):
+    """Re-extracts products from a cached crawl without starting a browser."""
+    print(f"Replaying cached crawl {crawl_id}...")
+    total_products = 0
+    replayed = set()
+    sink = StreamingSink(output_basename(adapter))
+    try:
+        for url, html_source in cache.iter_crawl(crawl_id):
+            if url in replayed:
+                # Fetched again within the crawl (a page redone after --resume)
+                continue
+            replayed.add(url)
+            # A load-more chain is cached in order, so the tiles seen so far are the high-water mark
+            high_water = total_products if adapter.pagination.cumulative else 0
+            products_on_page, _ = process_page(adapter, html_source, backend=backend, high_water=high_water)
+            total_products += len(products_on_page)
+            new_rows = sink.write_page(products_on_page)
+            print(f"Extracted {len(products_on_page)} products ({new_rows} new) from {url}. Total so far: {total_products}")
+    finally:
+        sink.close()
+        export_json(sink.jsonl_filename, f"{output_basename(adapter)}.json")
+
+
+def facet_url(adapter, facet):
+    """The listing URL of a facet given as a query string (``gender=women``), a path or a URL."""
+    if facet.startswith(('http://', 'https://', '/')):
+        return urljoin(adapter.base_url, facet)
+    start_url = adapter.start_url
+    separator = '' if start_url.endswith(('?', '&')) else '&' if '?' in start_url else '?'
+    return f"{start_url}{separator}{facet}"
+
+
+def plan_units(adapter, page_count=1, unit_pages=5, facets=()):
+    """Splits a crawl into WorkUnits for a ShardQueue.
+
+    Each facet becomes a 'cursor' unit that follows its own pagination
+    (facets may overlap; the merge dedups them). Without facets a numbered
+    pagination is cut into 'pages' units of ``unit_pages`` consecutive
+    pages, and a cursor-paginated catalog stays a single unit.
+    """
+    if facets:
+        return [
+            WorkUnit(f"facet-{number:03d}", 'cursor', [facet_url(adapter, facet)])
+            for number, facet in enumerate(facets, 1)
+        ]
+    if adapter.pagination.page_param is None:
+        return [WorkUnit('catalog', 'cursor', [adapter.start_url])]
+    units = []
+    for first in range(1, page_count + 1, unit_pages):
+        last = min(page_count, first + unit_pages - 1)
+        units.append(WorkUnit(
+            f"pages-{first:04d}-{last:04d}", 'pages',
+            [page_url(adapter, adapter.start_url, number) for number in range(first, last + 1)],
+        ))
+    return units
+
+
+def plan_shards(adapter, queue, fetcher, crawl_id, unit_pages=5, facets=(), page_count=None):
+    """Coordinator: plans the sharded crawl ``crawl_id`` into ``queue``.
+
+    Without ``page_count`` the first page is fetched to read the page count.
+    """
+    if not facets and adapter.pagination.page_param is not None and page_count is None:
+        result = fetcher.fetch(adapter.start_url)
+        if fetcher.failed(result):
+            raise RuntimeError(f"Could not load {adapter.start_url} to count the pages; pass --pages")
+        page_count = find_page_count(adapter, result.html)
+        print(f"Found {page_count} pages.")
+    if adapter.pagination.page_param is None and not facets:
+        print("A cursor-paginated catalog cannot be split without facets; planning a single unit.")
+    units = plan_units(adapter, page_count or 1, unit_pages, facets)
+    queue.plan(adapter.site, crawl_id, units)
+    print(f"Planned crawl {crawl_id}: {len(units)} unit(s) in {queue.path}, shards go to {queue.shard_dir}.")
+
+
+def _remove_shard(basename):
+    for extension in ('jsonl', 'csv', 'idx'):
+        if os.path.exists(f"{basename}.{extension}"):
+            os.remove(f"{basename}.{extension}")
+
+
+def run_shard_worker(adapter, queue, fetcher, worker, backend="html.parser", concurrent=False, parse_pool=None,
+                     identity_fields=IDENTITY_FIELDS, lease_seconds=600.0, poll=15.0):
+    """Worker: leases units from ``queue`` and crawls each into its own shard until every unit is finished.
+
+    The lease is renewed after every page. A unit with pages that could not
+    be fetched is handed back for another attempt, and so is the current
+    unit when the worker is interrupted.
+    """
+    key = partial(identity_key, fields=tuple(identity_fields))
+    while True:
+        unit = queue.lease(worker, lease_seconds)
+        if unit is None:
+            if queue.finished():
+                print(f"No units left in {queue.path}.")
+                return
+            # Other workers hold the rest; their leases may still run out
+            time.sleep(poll)
+            continue
+
+        print(f"Worker {worker} leased {unit.unit_id} ({len(unit.urls)} start page(s)).")
+        shard = f"{unit.unit_id}.{worker}"
+        basename = os.path.join(queue.shard_dir, shard)
+        sink = StreamingSink(basename, key=key)
+        frontier, done = set(unit.urls), set()
+        lost = False
+        try:
+            pages = iter_pages(
+                adapter, fetcher, unit.urls, backend=backend, concurrent=concurrent,
+                fanned_out=unit.kind == 'pages', parse_pool=parse_pool,
+            )
+            for page in write_pages(pages, sink):
+                done.add(page.url)
+                frontier.update(page.next_urls)
+                frontier -= done
+                if not queue.renew(unit.unit_id, worker, lease_seconds):
+                    lost = True
+                    break
+        except BaseException:
+            sink.close()
+            _remove_shard(basename)
+            queue.release(unit.unit_id, worker, "worker interrupted")
+            raise
+        sink.close()
+
+        if lost:
+            print(f"Lease on {unit.unit_id} was lost to another worker; dropping this shard.")
+            _remove_shard(basename)
+        elif frontier:
+            print(f"{len(frontier)} page(s) of {unit.unit_id} could not be fetched; handing it back.")
+            _remove_shard(basename)
+            queue.release(unit.unit_id, worker, f"{len(frontier)} page(s) could not be fetched")
+            time.sleep(poll)
+        elif not queue.complete(unit.unit_id, worker, shard, len(sink.index)):
+            # The lease ran out after the last renewal and another worker took the unit over
+            print(f"Lease on {unit.unit_id} was lost before it could be finished; dropping this shard.")
+            _remove_shard(basename)
+        else:
+            print(f"Finished {unit.unit_id}: {len(sink.index)} product(s) in {basename}.jsonl")
+
+
+def shard_pages(queue):
+    """One CrawlPage per done unit, read back from its shard."""
+    for unit_id, shard in queue.done_shards():
+        products = [ProductRecord.from_dict(row) for row in iter_jsonl(f"{shard}.jsonl")]
+        yield CrawlPage(unit_id, products, [], None, 'shard')
+
+
+def merge_shards(adapter, queue, identity_fields=IDENTITY_FIELDS, delta_only=False, price_history=True,
+                 columnar_format=None):
+    """Merges the shards of a finished sharded crawl into the site's output files.
+
+    Products are deduplicated by identity across shards and run through
+    the dedup store and price history exactly as a single-process crawl's
+    pages would be.
+    """
+    counts = queue.counts()
+    if counts['pending'] or counts['leased']:
+        raise RuntimeError(
+            f"{counts['pending'] + counts['leased']} unit(s) of crawl {queue.crawl_id} are not finished yet"
+        )
+    if counts['failed']:
+        print(f"Warning: {counts['failed']} unit(s) failed; their products are missing from the merge.")
+
+    crawl_id = queue.crawl_id
+    store = DedupStore(DEDUP_FILENAME, identity_fields=identity_fields)
+    history = PriceHistory(PRICE_HISTORY_FILENAME, identity_fields=store.identity_fields) if price_history else None
+    columnar = ColumnarSink(COLUMNAR_ROOT, adapter.site, crawl_id, fmt=columnar_format) if columnar_format else None
+    sink = StreamingSink(output_basename(adapter), key=store.key, mirrors=[columnar] if columnar else [])
+    try:
+        pages = shard_pages(queue)
+        if history is not None:
+            pages = record_prices(pages, history, crawl_id)
+        for _ in run_pipeline(
+            pages,
+            partial(classify_pages, store=store, crawl_id=crawl_id, delta_only=delta_only),
+            partial(write_pages, sink=sink),
+        ):
+            pass
+        store.report(adapter.site, crawl_id)
+        if history is not None:
+            history.report(crawl_id)
+    finally:
+        sink.close()
+        if columnar is not None:
+            columnar.close()
+        store.close()
+        if history is not None:
+            history.close()
+        export_json(sink.jsonl_filename, f"{output_basename(adapter)}.json")
+
+
+def print_shard_status(queue):
+    counts = queue.counts()
+    print(f"Crawl {queue.crawl_id} ({queue.site}): " + ', '.join(f"{count} {status}" for status, count in counts.items()))
+    for unit in queue.units():
+        lease = ''
+        if unit['status'] == 'leased':
+            lease = f" by {unit['worker']}, {unit['lease_until'] - time.time():.0f}s left"
+        rows = f", {unit['rows']} products" if unit['rows'] is not None else ''
+        error = f" ({unit['error']})" if unit['error'] else ''
+        print(f"  {unit['unit_id']:<20} {unit['status']:<8} attempts {unit['attempts']}{lease}{rows}{error}")
+
+
+def run_shard_command(adapter, args, cache=None):
+    """Runs ``--shard plan|work|merge|status`` against the queue at ``args.shard_queue``."""
+    queue = ShardQueue(args.shard_queue or queue_filename(adapter))
+    try:
+        if args.shard != 'plan' and queue.site != adapter.site:
+            raise RuntimeError(f"{queue.path} holds no planned {adapter.site} crawl")
+        if args.shard == 'status':
+            print_shard_status(queue)
+            return
+        if args.shard == 'merge':
+            merge_shards(
+                adapter, queue, args.identity_fields.split(','), args.delta_only, not args.no_price_history,
+                args.columnar,
+            )
+            return
+
+        crawl_id = queue.crawl_id if args.shard == 'work' else f"{adapter.site}-{time.strftime('%Y%m%dT%H%M%S')}"
+        pool, fetcher = build_fetcher(
+            adapter, args.fetch, getattr(args, 'browsers', 1), args.delay, args.attach, args.load_profile, args.rate,
+            args.min_delay, cache=cache, crawl_id=crawl_id, retries=args.retries,
+        )
+        parse_pool = ParsePool(args.parse_workers) if args.shard == 'work' and args.parse_workers > 0 else None
+        metrics = CrawlMetrics(adapter.site, args.metrics_dir)
+        crawl_metrics.activate(metrics)
+        try:
+            if args.shard == 'plan':
+                plan_shards(adapter, queue, fetcher, crawl_id, args.unit_pages, args.facet or (), args.pages)
+            else:
+                run_shard_worker(
+                    adapter, queue, fetcher, args.worker_id or f"{socket.gethostname()}-{os.getpid()}",
+                    backend=args.parser, concurrent=pool.size > 1 or args.fetch != 'selenium', parse_pool=parse_pool,
+                    identity_fields=args.identity_fields.split(','), lease_seconds=args.lease_seconds,
+                )
+        finally:
+            if parse_pool is not None:
+                parse_pool.close()
+            fetcher.close()
+            pool.close()
+            metrics.close()
+    finally:
+        queue.close()
+
+
+def save_data_to_files(adapter, data, json_filename=None, csv_filename=None):
+    """Saves the extracted data to both JSON and CSV files."""
+    json_filename = json_filename or f"{output_basename(adapter)}.json"
+    csv_filename = csv_filename or f"{output_basename(adapter)}.csv"
+    if not data:
+        print("No data to save.")
+        return
+
+    # Deduplicate the data, keeping first-seen order
+    final_data = [record.to_dict() for record in dict.fromkeys(data)]
+
+    # Save to JSON
+    with open(json_filename, 'w') as json_file:
+        json.dump(final_data, json_file, indent=4)
+    print(f"Data successfully saved to {json_filename}.")
+
+    # Save to CSV
+    if final_data:
+        keys = final_data[0].keys()
+        with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file:
+            dict_writer = csv.DictWriter(csv_file, fieldnames=keys)
+            dict_writer.writeheader()
+            dict_writer.writerows(final_data)
+        print(f"Data successfully saved to {csv_filename}.")
+
+
+def build_arg_parser(adapter):
+    fans_out = adapter.pagination.page_param is not None
+    parser = argparse.ArgumentParser(description=f"Scrape the {adapter.site} eyeglasses catalog")
+    parser.add_argument('--parser', choices=page_pipeline.PARSER_BACKENDS, default='html.parser', help="HTML parser backend")
+    if fans_out:
+        parser.add_argument('--browsers', type=int, default=1, help="Number of headless browsers to crawl with")
+    parser.add_argument('--attach', metavar='HOST:PORT', action='append',
+                        help="Attach to a running headless Chrome instead of starting one (repeatable, one per browser)")
+    parser.add_argument('--load-profile', choices=driver_setup.LOAD_PROFILES, default='lean',
+                        help="'lean' blocks images, media, fonts and trackers and loads pages eagerly; 'full' loads everything")
+    parser.add_argument('--delay', type=float, default=1.0, help="Seconds between requests to the same host")
+    parser.add_argument('--rate', choices=('adaptive', 'fixed'), default='adaptive',
+                        help="'adaptive' ramps concurrency and delay per host with the server's responses; 'fixed' keeps --delay")
+    parser.add_argument('--min-delay', type=float, default=0.25, help="Shortest delay the adaptive rate control may reach")
+    parser.add_argument('--base-url', help="Crawl a mirror or a local stub (see benchmarks/stub_site.py) instead of the live site")
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help="Parse pages in this many worker processes while fetching continues (0: parse inline)")
+    parser.add_argument('--fetch', choices=FETCH_MODES, default='selenium', help="Fetch backend; 'auto' tries plain HTTP before Selenium")
+    parser.add_argument('--cache-dir', default='./snapshot_cache', help="Directory of the HTML snapshot cache")
+    parser.add_argument('--no-cache', action='store_true', help="Do not store fetched pages in the snapshot cache")
+    parser.add_argument('--cache-ttl', type=float, default=None, help="Evict cached snapshots older than this many days")
+    parser.add_argument('--cache-max-mb', type=float, default=None, help="Evict the oldest snapshots beyond this cache size")
+    parser.add_argument('--replay', metavar='CRAWL_ID', help="Re-extract a cached crawl ('latest' for the most recent) without a browser")
+    parser.add_argument('--identity-fields', default=','.join(IDENTITY_FIELDS), help="Comma-separated fields that identify a product")
+    parser.add_argument('--delta-only', action='store_true', help="Only write products that are new or changed since the last crawl")
+    parser.add_argument('--no-price-history', action='store_true', help="Do not append price changes to the price history store")
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="Skip extracting pages whose products are unchanged since the last crawl (sends "
+                             "conditional requests over HTTP); their rows are carried over from the last output")
+    parser.add_argument('--sample', type=int, metavar='N',
+                        help="Fetch N pages seen in the last crawl first, and only crawl if one of them changed")
+    parser.add_argument('--columnar', choices=COLUMNAR_FORMATS, help="Also write Parquet or Arrow IPC files partitioned by site and crawl date")
+    details = parser.add_argument_group('product details', "Fetch every product's own page for what the listing lacks")
+    details.add_argument('--details', action='store_true',
+                         help="Add each product's SKU, frame size, material and colors from its product page")
+    details.add_argument('--detail-concurrency', type=int, default=8, help="Product pages fetched at once")
+    details.add_argument('--detail-max-age', type=float, default=7.0,
+                         help="Reuse details checked within this many days without a request (0: always revalidate)")
+    parser.add_argument('--metrics-dir', default='./metrics', help="Where to write the JSON event log and Prometheus metrics")
+    parser.add_argument('--resume', action='store_true', help="Continue the last interrupted crawl")
+    sharding = parser.add_argument_group('sharded crawls', "Spread one crawl over several processes or machines")
+    sharding.add_argument('--shard', choices=('plan', 'work', 'merge', 'status'),
+                          help="'plan' splits the crawl into units, 'work' crawls units until none are left, "
+                               "'merge' dedups the shards into the output files, 'status' shows progress")
+    sharding.add_argument('--shard-queue', metavar='PATH',
+                          help="Queue file shared by the coordinator and the workers (shards are written next to it)")
+    sharding.add_argument('--unit-pages', type=int, default=5, help="Listing pages per work unit")
+    sharding.add_argument('--pages', type=int, help="Page count of the catalog, instead of reading it from the first page")
+    sharding.add_argument('--facet', action='append',
+                          help="Plan one unit per facet: a query string such as 'gender=women' or a listing URL (repeatable)")
+    sharding.add_argument('--worker-id', help="Name of this worker in the queue (default: host name and process id)")
+    sharding.add_argument('--lease-seconds', type=float, default=600.0,
+                          help="How long a unit stays leased without progress before another worker may take it")
+    parser.add_argument(
+        '--retries', type=int, default=3,
+        help="Retries per page before leaving it pending" if fans_out else "Retries per page before stopping the crawl",
+    )
+    return parser
+
+
+def main(adapter, argv=None):
+    """Command line entry point for one site."""
+    parser = build_arg_parser(adapter)
+    args = parser.parse_args(argv)
+    if args.base_url:
+        adapter = dataclasses.replace(adapter, base_url=args.base_url.rstrip('/'))
+    if args.replay and args.no_cache:
+        parser.error("--replay needs the snapshot cache")
+    if args.details and adapter.details is None:
+        parser.error(f"No product page spec for {adapter.site}")
+    browsers = getattr(args, 'browsers', 1)
+
+    cache = None
+    if not args.no_cache:
+        cache = SnapshotCache(
+            args.cache_dir,
+            ttl=args.cache_ttl * 86400 if args.cache_ttl is not None else None,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb is not None else None,
+        )
+        cache.evict()
+
+    if args.shard:
+        try:
+            run_shard_command(adapter, args, cache)
+        except (RuntimeError, ValueError) as e:
+            parser.error(str(e))
+        finally:
+            if cache is not None:
+                cache.close()
+        return
+
+    if args.replay:
+        crawl_id = cache.latest_crawl_id(f"{adapter.site}-") if args.replay == 'latest' else args.replay
+        if crawl_id is None:
+            parser.error(f"No cached {adapter.site} crawl to replay")
+        replay_snapshots(adapter, cache, crawl_id, backend=args.parser)
+        cache.close()
+        return
+
+    state = CrawlState.load(state_filename(adapter)) if args.resume else None
+    if state is not None:
+        print(f"Resuming crawl {state.crawl_id} with {len(state.pending)} pending page(s)...")
+    else:
+        if args.resume:
+            print("No interrupted crawl found. Starting a new one.")
+        state = CrawlState(state_filename(adapter), f"{adapter.site}-{time.strftime('%Y%m%dT%H%M%S')}")
+        state.add_pending([adapter.start_url])
+    # Only wipe the outputs for a fresh crawl; a resumed one truncates them to the last completed page
+    resumed = bool(state.completed)
+
+    identity_fields = tuple(args.identity_fields.split(','))
+    fingerprints = None
+    if args.skip_unchanged or args.sample:
+        fingerprints = FingerprintStore(
+            FINGERPRINT_FILENAME, adapter.site, partial(identity_key, fields=identity_fields),
+            skip_unchanged=args.skip_unchanged,
+        )
+    pool, fetcher = build_fetcher(
+        adapter, args.fetch, browsers, args.delay, args.attach, args.load_profile, args.rate, args.min_delay,
+        cache=cache, crawl_id=state.crawl_id, retries=args.retries,
+        conditional=fingerprints.conditional_headers if fingerprints is not None else None,
+    )
+    if args.sample and not resumed and not crawl_needed(adapter, fetcher, fingerprints, args.sample):
+        print("No changes found; skipping this crawl.")
+        fetcher.close()
+        pool.close()
+        fingerprints.close()
+        if cache is not None:
+            cache.close()
+        return
+    parse_pool = ParsePool(args.parse_workers) if args.parse_workers > 0 else None
+    metrics = CrawlMetrics(adapter.site, args.metrics_dir)
+    crawl_metrics.activate(metrics)
+    details = None
+    if args.details:
+        details = build_detail_fetcher(
+            adapter, pool, args.fetch, args.detail_concurrency, args.detail_max_age * 86400, args.delay, args.rate,
+            args.min_delay, backend=args.parser,
+        )
+    # Read before the sink truncates the output: skipped pages' rows come from here
+    carried = previous_rows(adapter, fingerprints.key, resumed) if args.skip_unchanged else None
+    store = DedupStore(DEDUP_FILENAME, identity_fields=identity_fields)
+    history = None if args.no_price_history else PriceHistory(PRICE_HISTORY_FILENAME, identity_fields=store.identity_fields)
+    columnar = ColumnarSink(COLUMNAR_ROOT, adapter.site, state.crawl_id, fmt=args.columnar) if args.columnar else None
+    sink = StreamingSink(
+        output_basename(adapter), resume=resumed, offsets=state.offsets, key=store.key,
+        mirrors=[columnar] if columnar else [],
+    )
+    # Page numbers are predictable, so when pages can be fetched concurrently
+    # fan out over all of them instead of following next links
+    concurrent = pool.size > 1 or args.fetch != 'selenium'
+
+    try:
+        pages = iter_pages(
+            adapter, fetcher, state.pending, backend=args.parser, concurrent=concurrent,
+            fanned_out=state.fanned_out, parse_pool=parse_pool, fingerprints=fingerprints, high_water=state.high_water,
+        )
+        if carried is not None:
+            pages = carry_forward(pages, carried)
+        if history is not None:
+            pages = record_prices(pages, history, state.crawl_id)
+        stages = [partial(enrich_pages, details=details)] if details is not None else []
+        stages += [
+            partial(classify_pages, store=store, crawl_id=state.crawl_id, delta_only=args.delta_only),
+            partial(write_pages, sink=sink, total_products=state.total_products),
+        ]
+        if fingerprints is not None:
+            stages.append(partial(record_fingerprints, fingerprints=fingerprints, store=store, crawl_id=state.crawl_id))
+        stages.append(partial(track_state, state=state, sink=sink))
+        for _ in run_pipeline(pages, *stages):
+            pass
+
+        store.report(adapter.site, state.crawl_id)
+        if details is not None:
+            details.report(state.crawl_id)
+        if fingerprints is not None:
+            fingerprints.report(state.crawl_id)
+        if history is not None:
+            history.report(state.crawl_id)
+        if state.pending:
+            print(f"{len(state.pending)} page(s) still pending. Run again with --resume to continue.")
+        else:
+            state.clear()
+
+    finally:
+        if parse_pool is not None:
+            parse_pool.close()
+        if details is not None:
+            details.close()
+            details.store.close()
+        fetcher.close()
+        pool.close()
+        # Rows were appended page by page; the JSON export is written once
+        sink.close()
+        if columnar is not None:
+            columnar.close()
+        store.close()
+        if history is not None:
+            history.close()
+        if fingerprints is not None:
+            fingerprints.close()
+        metrics.close()
+        export_json(sink.jsonl_filename, f"{output_basename(adapter)}.json")
+        if cache is not None:
+            cache.close()
+        print("\nScraping complete. WebDriver closed.")
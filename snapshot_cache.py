@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class SnapshotCache:
+    """Compressed, content-addressed store of fetched pages.
+
+    Page bodies are gzip'd under ``objects/<aa>/<sha256>.html.gz`` so identical
+    pages are stored once. A SQLite index maps (crawl id, URL) to the body and
+    records when, with which status and through which backend it was fetched.
+    """
+
+    def __init__(self, cache_dir='./snapshot_cache', ttl=None, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        # Pages may be stored from a fetch thread (see pipeline.buffered)
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                crawl_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                status INTEGER,
+                backend TEXT,
+                digest TEXT NOT NULL REFERENCES objects(digest)
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_url ON snapshots(url, fetched_at);
+            CREATE INDEX IF NOT EXISTS snapshots_crawl ON snapshots(crawl_id, id);
+        """)
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest[:2], f"{digest}.html.gz")
+
+    def put(self, url, html_source, crawl_id, status=None, backend=None, fetched_at=None):
+        """Stores a fetched page and returns its content digest."""
+        body = html_source.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        with self.lock:
+            self._put(url, body, digest, crawl_id, status, backend, fetched_at)
+        return digest
+
+    def _put(self, url, body, digest, crawl_id, status, backend, fetched_at):
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with gzip.open(tmp_path, 'wb') as object_file:
+                object_file.write(body)
+            os.replace(tmp_path, path)
+            self.db.execute(
+                "INSERT OR REPLACE INTO objects (digest, size) VALUES (?, ?)", (digest, os.path.getsize(path))
+            )
+        self.db.execute(
+            "INSERT INTO snapshots (crawl_id, url, fetched_at, status, backend, digest) VALUES (?, ?, ?, ?, ?, ?)",
+            (crawl_id, url, fetched_at or time.time(), status, backend, digest),
+        )
+        self.db.commit()
+
+    def read(self, digest):
+        with gzip.open(self._object_path(digest), 'rb') as object_file:
+            return object_file.read().decode('utf-8')
+
+    def get(self, url, max_age=None):
+        """Returns the newest cached body for ``url``, or None if missing or older than ``max_age`` seconds."""
+        row = self.db.execute(
+            "SELECT digest, fetched_at FROM snapshots WHERE url = ? ORDER BY fetched_at DESC LIMIT 1", (url,)
+        ).fetchone()
+        if row is None or (max_age is not None and time.time() - row[1] > max_age):
+            return None
+        return self.read(row[0])
+
+    def latest_crawl_id(self, prefix=''):
+        row = self.db.execute(
+            "SELECT crawl_id FROM snapshots WHERE crawl_id LIKE ? ORDER BY id DESC LIMIT 1", (f"{prefix}%",)
+        ).fetchone()
+        return row[0] if row else None
+
+    def iter_crawl(self, crawl_id):
+        """Yields ``(url, html_source)`` for a crawl in the order the pages were fetched."""
+        rows = self.db.execute(
+            "SELECT url, digest FROM snapshots WHERE crawl_id = ? ORDER BY id", (crawl_id,)
+        ).fetchall()
+        for url, digest in rows:
+            yield url, self.read(digest)
+
+    def evict(self):
+        """Drops snapshots older than the TTL, then the oldest ones until under ``max_bytes``."""
+        if self.ttl is not None:
+            self.db.execute("DELETE FROM snapshots WHERE fetched_at < ?", (time.time() - self.ttl,))
+
+        if self.max_bytes is not None:
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self.db.execute("SELECT MIN(fetched_at) FROM snapshots").fetchone()[0]
+                if oldest is None:
+                    break
+                self.db.execute("DELETE FROM snapshots WHERE fetched_at = ?", (oldest,))
+                total -= self._drop_orphans()
+
+        self._drop_orphans()
+        self.db.commit()
+
+    def _drop_orphans(self):
+        orphans = self.db.execute(
+            "SELECT digest, size FROM objects WHERE digest NOT IN (SELECT digest FROM snapshots)"
+        ).fetchall()
+        for digest, _ in orphans:
+            path = self._object_path(digest)
+            if os.path.exists(path):
+                os.remove(path)
+        self.db.executemany("DELETE FROM objects WHERE digest = ?", [(digest,) for digest, _ in orphans])
+        return sum(size for _, size in orphans)
+
+    def close(self):
+        self.db.close()